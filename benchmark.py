@@ -0,0 +1,296 @@
+import argparse
+import contextlib
+import hashlib
+import http.server
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import dts_generator as generator
+
+# Benchmarks the stages of the generator (load, fetch, infer, render, write) against a synthetic
+# service corpus and a local stand-in for GITHUB_BASE_URL, and stores the timings as JSON baselines.
+
+BASELINE_PATH = "./benchmark_baselines" # Define where the benchmark results are saved and compared from
+
+REGRESSION_THRESHOLD = 0.10 # Define the slowdown (relative to the baseline) reported as a regression
+
+PARAMETER_TYPES = ["string", "Integer", "long", "boolean", "NativeObject", "NativeArray", "StringArray", "map", "ASC|DESC"]
+
+
+def seeded_random(*parts):
+    return random.Random(hashlib.sha256("/".join(str(part) for part in parts).encode('utf-8')).hexdigest())
+
+
+def generate_corpus(path, service_count, operation_count, seed=0):
+    # Write service_count service JSONs with operation_count operations each, in the portal's
+    # serviceName/operations/paramInfo format, and return the names of the services.
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    service_names = []
+    for service_index in range(service_count):
+        rng = seeded_random(seed, "service", service_index)
+        service_name = f"Bench{service_index:03d}Service{rng.choice(['Entity', 'Friend', 'Group', 'Lobby'])}"
+        operations = []
+        for operation_index in range(operation_count):
+            params = [{"name": f"param{param_index}", "type": rng.choice(PARAMETER_TYPES), "desc": f"Parameter {param_index}."}
+                      for param_index in range(rng.randint(0, 4))]
+            operations.append({"apiMethod": f"BenchOperation{operation_index:03d}",
+                               "desc": f"Benchmark operation {operation_index} of {service_name}.",
+                               "paramInfo": params})
+
+        with open(f"{path}/{service_name}.json", "w") as output:
+            json.dump({"serviceName": service_name, "operations": operations}, output, indent=2)
+        service_names.append(service_name)
+
+    return service_names
+
+
+def generate_json_value(rng, depth):
+    kind = rng.random()
+    if depth > 3 or kind < 0.4:
+        return rng.choice([rng.randint(0, 1000), "text", True, None, 1.5])
+    if kind < 0.7:
+        return {f"field{index}": generate_json_value(rng, depth + 1) for index in range(rng.randint(1, 6))}
+    return [generate_json_value(rng, depth + 1) for index in range(rng.randint(0, 8))]
+
+
+def generate_md_page(service_name, method_name, seed=0):
+    # Render a documentation page shaped like the braincloud-docs ones, with a request example and a JSON response.
+    rng = seeded_random(seed, "page", service_name, method_name)
+    response = {"data": {f"field{index}": generate_json_value(rng, 1) for index in range(rng.randint(1, 8))}, "status": 200}
+    return (f"# {method_name}\n\n"
+            f"Benchmark page for {service_name}.{method_name}.\n\n"
+            f"## Method Parameters\n"
+            f"Parameter | Description\n"
+            f"--------- | -----------\n"
+            f"param0 | The first parameter.\n\n"
+            f"## Usage\n\n"
+            f"```javascript\n"
+            f"var proxy = bridge.get{service_name}ServiceProxy();\n"
+            f"var postResult = proxy.{method_name}();\n"
+            f"```\n\n"
+            f"<details>\n"
+            f"<summary>JSON Response</summary>\n\n"
+            f"```json\n"
+            f"{json.dumps(response, indent=4)}\n"
+            f"```\n"
+            f"</details>\n")
+
+
+class FakeDocsHandler(http.server.BaseHTTPRequestHandler):
+    # Serves generated "/<service>/<method>.md" pages after the server's latency,
+    # answering a deterministic share of the URLs with 404 and revalidations with 304.
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, Nagle plus delayed ACKs would add ~40 ms to every keep-alive request.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        server.request_count += 1
+
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 2 or not parts[1].endswith(".md") or seeded_random(server.seed, "404", self.path).random() < server.not_found_rate:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = generate_md_page(parts[0], parts[1][:-3], server.seed).encode('utf-8')
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeDocsServer(http.server.ThreadingHTTPServer):
+    # The default listen backlog of 5 drops connections under concurrent fetches, which shows up as 1 s SYN retries.
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def start_fake_docs_server(latency=0.0, not_found_rate=0.0, seed=0, port=0):
+    # Start the stand-in for GITHUB_BASE_URL on a background thread; returns the server and its base URL.
+    server = FakeDocsServer(("127.0.0.1", port), FakeDocsHandler)
+    server.latency = latency
+    server.not_found_rate = not_found_rate
+    server.seed = seed
+    server.request_count = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def run_stages(source_path, target_path, fetch_jobs):
+    # Run each stage of a generation once and return the wall time of each.
+    timings = {}
+
+    started = time.perf_counter()
+    services = []
+    for name in sorted(os.listdir(source_path)):
+        with open(f"{source_path}/{name}", "rb") as output:
+            source = output.read()
+        services.append(generator.normalize_service(source, generator.content_hash(source)))
+    timings["load"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=fetch_jobs) as executor:
+        md_futures = [[executor.submit(generator.fetch_md_content, service.name.lower(), operation.api_method.lower())
+                       for operation in service.operations]
+                      for service in services]
+        md_contents = [[md_future.result() for md_future in futures] for futures in md_futures]
+    timings["fetch"] = time.perf_counter() - started
+
+    # Extracting the responses and inferring their types is the bulk of building the interfaces.
+    # Each repeat infers with a memo of its own, so no repeat gets the types of an earlier one for free.
+    started = time.perf_counter()
+    return_types = {}
+    interfaces = [generator.build_service_interface(service, contents, return_types)
+                  for service, contents in zip(services, md_contents)]
+    timings["infer"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    outputs = dict(generator.render_outputs(zip(services, interfaces)))
+    timings["render"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for output_file, content in outputs.items():
+        with open(f"{target_path}/{output_file}", "w") as file:
+            file.write(content)
+    timings["write"] = time.perf_counter() - started
+
+    timings["bytes"] = sum(len(content.encode('utf-8')) for content in outputs.values())
+    return timings
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare_results(results, baseline):
+    # Print the change of every stage against the baseline and return the stages that regressed.
+    regressions = []
+    print(f"{'stage':<8} {'baseline':>10} {'current':>10} {'change':>8}")
+    for stage, current in results["stages"].items():
+        previous = baseline["stages"].get(stage)
+        if previous is None or previous["median"] == 0:
+            print(f"{stage:<8} {'-':>10} {current['median']:>10.4f}")
+            continue
+        change = current["median"] / previous["median"] - 1
+        print(f"{stage:<8} {previous['median']:>10.4f} {current['median']:>10.4f} {change:>+8.1%}")
+        if change > REGRESSION_THRESHOLD:
+            regressions.append(stage)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the DTS generation stages on a synthetic corpus.")
+    parser.add_argument("--services", type=int, default=40, help="number of synthetic service JSONs (default 40)")
+    parser.add_argument("--operations", type=int, default=30, help="number of operations per service (default 30)")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds the fake docs server waits per request (default 0.005)")
+    parser.add_argument("--not-found-rate", type=float, default=0.1, help="share of pages answered with 404 (default 0.1)")
+    parser.add_argument("--fetch-jobs", type=int, default=16, help="number of concurrent fetches (default 16)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs per stage, the median is reported (default 3)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic corpus and pages (default 0)")
+    parser.add_argument("--save", nargs="?", const="", default=None,
+                        help=f"save the results as {BASELINE_PATH}/<label>.json (default label: the git revision)")
+    parser.add_argument("--compare", help="baseline JSON file to compare the results against")
+    parser.add_argument("--serve", type=int, default=None,
+                        help="only run the fake docs server on this port, e.g. to point --docs of the generator at it")
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        server, base_url = start_fake_docs_server(args.latency, args.not_found_rate, args.seed, args.serve)
+        print(f"Serving synthetic documentation pages on {base_url}, press Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            return
+
+    server, base_url = start_fake_docs_server(args.latency, args.not_found_rate, args.seed)
+    generator.docs_source = generator.HttpDocsSource(base_url)
+    generator.docs_cache = None
+    generator.http_client = generator.HttpClient(pool_size=args.fetch_jobs, rate_limit=0)
+
+    work_path = tempfile.mkdtemp(prefix="dts-benchmark-")
+    try:
+        source_path = f"{work_path}/json"
+        target_path = f"{work_path}/DTS_Files"
+        os.makedirs(target_path)
+        generate_corpus(source_path, args.services, args.operations, args.seed)
+
+        # The generator prints an error line per missing page, which would drown the results.
+        runs = []
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                for run in range(args.repeat):
+                    runs.append(run_stages(source_path, target_path, args.fetch_jobs))
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+        server.shutdown()
+
+    results = {
+        "label": args.save or git_revision(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {"services": args.services, "operations": args.operations, "latency": args.latency,
+                   "not_found_rate": args.not_found_rate, "fetch_jobs": args.fetch_jobs, "seed": args.seed},
+        "output_bytes": runs[0]["bytes"],
+        "stages": {stage: {"median": statistics.median(run[stage] for run in runs),
+                           "min": min(run[stage] for run in runs),
+                           "runs": [run[stage] for run in runs]}
+                   for stage in ("load", "fetch", "infer", "render", "write")}
+    }
+
+    for stage, timing in results["stages"].items():
+        print(f"{stage:<8} median {timing['median']:.4f}s  min {timing['min']:.4f}s")
+    print(f"output   {results['output_bytes']} bytes")
+
+    if args.save is not None:
+        if not os.path.isdir(BASELINE_PATH):
+            os.makedirs(BASELINE_PATH)
+        with open(f"{BASELINE_PATH}/{results['label']}.json", "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"Saved {BASELINE_PATH}/{results['label']}.json")
+
+    if args.compare:
+        with open(args.compare, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline["corpus"] != results["corpus"]:
+            print("Warning: the baseline was measured on a different corpus.")
+        regressions = compare_results(results, baseline)
+        if regressions:
+            print(f"Regressed by more than {REGRESSION_THRESHOLD:.0%}: {', '.join(regressions)}")
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
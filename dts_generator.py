@@ -0,0 +1,2654 @@
+# Generates the brainCloud cloud code service proxy DTS files; updated-version-generator.py is its command line.
+
+import base64
+import collections
+import contextlib
+import ctypes
+import ctypes.util
+import gc
+import gzip
+import hashlib
+import heapq
+import http.client
+import http.server
+import io
+import json
+import queue
+import random
+import re
+import os
+import pickle
+import select
+import struct
+import subprocess
+import sys
+# import requests # Import the requests library
+import urllib.parse
+import urllib.request
+import urllib.error
+import ssl
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import brotli # Optional, adds .br variants to the --hashed outputs
+except ImportError:
+    brotli = None
+
+GITHUB_BASE_URL = "https://raw.githubusercontent.com/getbraincloud/braincloud-docs/develop/docs/api/2_capi/"
+
+DOCS_API_FOLDER = "2_capi" # Define the folder of the braincloud-docs tree that holds the cloud code API pages
+
+MAX_DEPTH_FOR_TYPE_GENERATION = 3 # Define the maximum depth for type generation in data json
+
+EXCLUDED_METHODS = {
+    # "Identity": ["attach", "merge", "detach"],
+    # "VirtualCurrency": ["resetCurrencyState"]
+    "AppStore": ["awardProductHook"]
+}
+
+EXCLUDED_SERVICES = ["Script", "Authenticate", "Dispatcher"]
+
+MANIFEST_FILE_NAME = ".dts_manifest.json" # Define the file next to the outputs that records the hashes of the last run
+MANIFEST_VERSION = 3
+MODEL_SNAPSHOT_FILE_NAME = ".dts_models.pickle" # Define the file next to the outputs that keeps the normalized services for the next run
+MODEL_SNAPSHOT_VERSION = 2
+
+INFERENCE_MAX_NODES = 20000 # Define the maximum number of JSON values visited when inferring one response type
+INFERENCE_ARRAY_SAMPLE_SIZE = 32 # Define the maximum number of elements of an array inspected when inferring its type
+
+BUNDLE_FILE_NAME = "lib.cloudcode.bundle.d.ts" # Define the file all outputs are packed into with --bundle
+BUNDLE_INDEX_FILE_NAME = "lib.cloudcode.bundle.index.json"
+BUNDLE_VERSION = 1
+
+SIGNATURE_INDEX_FILE_NAME = "lib.cloudcode.signatures.json" # Define the file recording the fingerprint of every method, to diff the next run against
+SIGNATURE_INDEX_VERSION = 1
+DELTA_FILE_NAME = "lib.cloudcode.delta.json" # Define the file the changes since the --previous-index run are written to
+
+COMPLETION_INDEX_FILE_NAME = "lib.cloudcode.completions.json" # Define the file the editor reads its completions from before the typings load
+COMPLETION_INDEX_VERSION = 1
+
+ASSETS_FILE_NAME = "lib.cloudcode.assets.json" # Define the file mapping each output to its content-addressed copy with --hashed
+ASSETS_VERSION = 1
+ASSET_HASH_LENGTH = 16 # Define how many hex digits of the sha256 of a file go into its content-addressed name
+ASSET_ENCODINGS = [("gzip", ".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+if brotli is not None:
+    ASSET_ENCODINGS.append(("br", ".br", lambda data: brotli.compress(data, quality=11)))
+
+WATCH_DEBOUNCE = 0.2 # Define how long (in seconds) --watch waits for further changes before regenerating
+WATCH_POLL_INTERVAL = 1.0 # Define how often (in seconds) --watch scans the folder when inotify is not available
+INOTIFY_MASK = 0x008 | 0x040 | 0x080 | 0x100 | 0x200 # IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+SERVE_CACHE_SIZE = 64 # Define how many services --serve keeps parsed and rendered in memory
+PAGE_CACHE_SIZE = 8192 # Define how many documentation pages --watch and --serve keep in memory
+PAGE_MAX_AGE = 600 # Define how long (in seconds) --watch and --serve use a page (or a service rendered from it) before fetching it again
+
+PROFILE_SLOWEST_URLS = 20 # Define how many of the slowest documentation requests the run report lists
+
+GIT_CLOSE_TIMEOUT = 10 # Define how long (in seconds) closing a --git-rev source waits for "git cat-file" to exit before killing it
+
+FETCH_CONCURRENCY = 16 # Define the maximum number of documentation pages fetched at the same time
+PIPELINE_LOOKAHEAD = 4 # Define how many services ahead iter_operations fetches the documentation pages of
+
+# def fetch_md_content(service_name, method_name):
+#     url = f"{GITHUB_BASE_URL}{service_name}/{method_name}.md"
+#     try:
+#         headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+#         response = requests.get(url, headers=headers, timeout=10) # Removed verify=False again
+#         response.raise_for_status()  # Raise an exception for HTTP errors
+#         return response.text
+#     except requests.exceptions.RequestException as e:
+#         # print(f"Error fetching {url}: {e}")
+#         return None
+
+HTTP_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+
+HTTP_POOL_SIZE = FETCH_CONCURRENCY # Define the maximum number of persistent connections kept open per host
+HTTP_RATE_LIMIT = 50 # Define the maximum number of requests per second sent to a host (0 for no limit)
+HTTP_TIMEOUT = 10 # Define the timeout (in seconds) of connecting and of each read
+HTTP_RETRIES = 3 # Define how many times a timeout, connection error, 429 or 5xx response is retried
+HTTP_BACKOFF = 0.5 # Define the base (in seconds) of the jittered exponential backoff between retries
+HTTP_MAX_RETRY_AFTER = 30 # Define the longest Retry-After (in seconds) honoured between retries
+HTTP_MAX_REDIRECTS = 3
+HTTP_CIRCUIT_BREAKER_THRESHOLD = 5 # Define how many consecutive failed attempts make a host fail fast
+HTTP_CIRCUIT_BREAKER_COOLDOWN = 30 # Define how long (in seconds) a failing host is skipped before it is tried again
+
+CACHE_PATH = "./.docs_cache" # Define where fetched documentation pages are cached between runs
+CACHE_MAX_BYTES = 64 * 1024 * 1024 # Define the size the cache is trimmed back to (least recently used first)
+CACHE_NEGATIVE_MAX_AGE = 24 * 60 * 60 # Define how long (in seconds) a missing (404) page is remembered
+CACHE_EVICT_INTERVAL = 600 # Define how often (in seconds) --serve trims the cache back to its size while it runs
+
+docs_cache = None # The DocsCache used for documentation pages fetched over HTTP, if caching is enabled
+docs_source = None # The source fetch_md_content reads the documentation pages from
+
+
+class RunStats:
+    # Thread-safe collector of where the time of a run goes: wall time, calls and bytes per stage,
+    # cache outcomes, HTTP statuses and the slowest URLs. Worker processes collect their own
+    # and send a snapshot back to be merged. Only the PROFILE_SLOWEST_URLS slowest requests are kept, in a heap,
+    # so a long --serve or --watch session does not hold on to every request it made.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        self.counters = {}
+        self.http_status = {}
+        self.requests = []
+
+    @contextlib.contextmanager
+    def stage(self, name, size=0):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - started, size)
+
+    def add_stage(self, name, seconds, size=0, calls=1):
+        with self.lock:
+            stage = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "bytes": 0})
+            stage["calls"] += calls
+            stage["seconds"] += seconds
+            stage["bytes"] += size
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_request(self, url, seconds, status):
+        with self.lock:
+            self.http_status[str(status)] = self.http_status.get(str(status), 0) + 1
+            if len(self.requests) < PROFILE_SLOWEST_URLS:
+                heapq.heappush(self.requests, (seconds, url, status))
+            else:
+                heapq.heappushpop(self.requests, (seconds, url, status))
+
+    def snapshot(self):
+        with self.lock:
+            return {"stages": {name: dict(stage) for name, stage in self.stages.items()}, "counters": dict(self.counters),
+                    "http_status": dict(self.http_status), "requests": list(self.requests)}
+
+    def merge(self, snapshot):
+        for name, stage in snapshot["stages"].items():
+            self.add_stage(name, stage["seconds"], stage["bytes"], stage["calls"])
+        for name, amount in snapshot["counters"].items():
+            self.count(name, amount)
+        for seconds, url, status in snapshot["requests"]:
+            self.add_request(url, seconds, status)
+
+    def report(self):
+        snapshot = self.snapshot()
+        return {
+            "stages": snapshot["stages"],
+            "counters": snapshot["counters"],
+            "http_status": snapshot["http_status"],
+            "slowest_urls": [{"url": url, "seconds": seconds, "status": status}
+                             for seconds, url, status in sorted(snapshot["requests"], reverse=True)]
+        }
+
+
+stats = RunStats() # Collects the instrumentation of the current run, see --profile
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class TokenBucket:
+    # Allows "rate" requests per second on average with bursts of up to "capacity"; acquire() blocks until allowed.
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    # Opens after "threshold" consecutive failures (connection errors, and server errors left after the retries),
+    # so requests fail immediately instead of each one waiting out its timeouts. After "cooldown" seconds a single
+    # trial request is let through to probe the host again.
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def check(self, host):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.cooldown:
+                raise CircuitOpenError(f"{host} is failing, not trying again for {self.cooldown} seconds")
+            self.opened_at = time.monotonic() # Half-open: this request is the trial, the others keep failing fast
+
+    def record(self, success):
+        # Returns whether the circuit is open after this request.
+        with self.lock:
+            if success:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.monotonic()
+            return self.opened_at is not None
+
+
+class HttpClient:
+    # Keep-alive HTTP(S) client reusing up to pool_size persistent connections per host, limited to rate_limit
+    # requests per second, retrying transient failures (timeouts, connection errors, 429 and 5xx) with jittered
+    # exponential backoff and failing fast through a per-host circuit breaker.
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, rate_limit=HTTP_RATE_LIMIT, retries=HTTP_RETRIES, timeout=HTTP_TIMEOUT):
+        self.pool_size = pool_size
+        self.bucket = TokenBucket(rate_limit, max(1, rate_limit)) if rate_limit else None
+        self.retries = retries
+        self.timeout = timeout
+        self.context = ssl._create_unverified_context()
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def _host(self, key):
+        # Each host gets its idle connections, a semaphore bounding its open connections and a circuit breaker.
+        with self.lock:
+            if key not in self.hosts:
+                self.hosts[key] = (queue.LifoQueue(), threading.BoundedSemaphore(self.pool_size),
+                                   CircuitBreaker(HTTP_CIRCUIT_BREAKER_THRESHOLD, HTTP_CIRCUIT_BREAKER_COOLDOWN))
+            return self.hosts[key]
+
+    def _connect(self, scheme, host, port):
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.context)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _request(self, key, path, headers):
+        # Send one request over an idle (or new) connection and read the whole response so the connection can be reused.
+        idle, slots, breaker = self._host(key)
+        with slots:
+            try:
+                connection, reused = idle.get_nowait(), True
+            except queue.Empty:
+                connection, reused = self._connect(*key), False
+            try:
+                try:
+                    connection.request("GET", path, headers=headers)
+                    response = connection.getresponse()
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    if not reused:
+                        raise
+                    # The server closed the idle connection in the meantime, retry once on a fresh one.
+                    connection.close()
+                    connection = self._connect(*key)
+                    connection.request("GET", path, headers=headers)
+                    response = connection.getresponse()
+                body = response.read()
+            except BaseException:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                idle.put(connection)
+            return response, body
+
+    def get(self, url, headers):
+        # Perform a GET request and return the response status, headers and body.
+        # Like urllib, responses other than 2xx (including 304 Not Modified) are raised as urllib.error.HTTPError.
+        headers = dict(headers, **{'Accept-Encoding': 'gzip'})
+        for redirect in range(HTTP_MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+            path = parts.path + (f"?{parts.query}" if parts.query else "")
+            breaker = self._host(key)[2]
+
+            for attempt in range(self.retries + 1):
+                breaker.check(parts.hostname)
+                if self.bucket is not None:
+                    self.bucket.acquire()
+
+                retry_after = None
+                try:
+                    response, body = self._request(key, path, headers)
+                except (OSError, http.client.HTTPException) as e:
+                    if isinstance(e, http.client.InvalidURL):
+                        raise
+                    opened = breaker.record(False)
+                    if attempt == self.retries:
+                        # The requests already in flight when the circuit opens fail with it too, so a caller
+                        # stops on them instead of carrying on without their pages.
+                        if opened:
+                            raise CircuitOpenError(f"{parts.hostname} is failing: {e}") from e
+                        raise
+                else:
+                    if response.status != 429 and response.status < 500:
+                        breaker.record(True)
+                        break
+                    # A 429 only asks to slow down, and a 5xx counts against the host once the retries are used up,
+                    # so a short burst of them is waited out instead of opening the circuit.
+                    if attempt == self.retries:
+                        if response.status != 429:
+                            breaker.record(False)
+                        break
+                    retry_after = response.getheader('Retry-After')
+
+                stats.count("http_retries")
+                delay = random.uniform(0, HTTP_BACKOFF * 2 ** attempt)
+                if retry_after is not None and retry_after.isdigit():
+                    delay = max(delay, min(int(retry_after), HTTP_MAX_RETRY_AFTER))
+                time.sleep(delay)
+
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                url = urllib.parse.urljoin(url, response.getheader('Location'))
+                continue
+            break
+
+        if response.getheader('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        if not 200 <= response.status < 300:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.msg, None)
+        return response.status, response.msg, body
+
+
+http_client = None # The HttpClient used by http_get, created on first use
+
+
+def http_get(url, headers):
+    # Perform a GET request and return the response status, headers and body.
+    # HTTP errors (including 304 Not Modified) are raised as urllib.error.HTTPError.
+    global http_client
+    if http_client is None:
+        http_client = HttpClient()
+
+    started = time.perf_counter()
+    status = None
+    try:
+        status, response_headers, content = http_client.get(url, headers)
+        return status, response_headers, content
+    except urllib.error.HTTPError as e:
+        status = e.code
+        raise
+    except Exception as e:
+        # Connection problems are reported by the type of the error rather than a status.
+        status = type(e).__name__
+        raise
+    finally:
+        stats.add_request(url, time.perf_counter() - started, status)
+
+
+class DocsCache:
+    # On-disk HTTP cache of the documentation pages, keyed by URL.
+    # Each entry is a "<sha256 of url>.json" metadata file (status, ETag, Last-Modified, fetch time)
+    # next to a "<sha256 of url>.body" file. The metadata file mtime doubles as the last-used time for LRU eviction.
+
+    def __init__(self, path, max_age=None, negative_max_age=CACHE_NEGATIVE_MAX_AGE, max_bytes=CACHE_MAX_BYTES, refresh=False):
+        self.path = path
+        self.max_age = max_age
+        self.negative_max_age = negative_max_age
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def _entry_path(self, url):
+        return os.path.join(self.path, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def _load(self, url):
+        entry_path = self._entry_path(url)
+        try:
+            with open(f"{entry_path}.json", "r") as meta_file:
+                meta = json.load(meta_file)
+            body = None
+            if meta["status"] == 200:
+                with open(f"{entry_path}.body", "rb") as body_file:
+                    body = body_file.read()
+        except (OSError, ValueError, KeyError):
+            return None, None
+        return meta, body
+
+    def _touch(self, url):
+        try:
+            os.utime(f"{self._entry_path(url)}.json")
+        except OSError:
+            pass
+
+    def _store(self, url, meta, body):
+        # Write to temporary files first so a concurrent or interrupted run never sees a partial entry.
+        entry_path = self._entry_path(url)
+        if body is not None:
+            with open(f"{entry_path}.body.tmp", "wb") as body_file:
+                body_file.write(body)
+            os.replace(f"{entry_path}.body.tmp", f"{entry_path}.body")
+        with open(f"{entry_path}.json.tmp", "w") as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(f"{entry_path}.json.tmp", f"{entry_path}.json")
+
+    def fetch(self, url):
+        now = time.time()
+        meta, body = (None, None) if self.refresh else self._load(url)
+
+        if meta is not None:
+            age = now - meta["fetched_at"]
+            if meta["status"] == 404 and age < self.negative_max_age:
+                self._touch(url)
+                stats.count("cache_negative_hits")
+                return None
+            if meta["status"] == 200 and self.max_age is not None and age < self.max_age:
+                self._touch(url)
+                stats.count("cache_hits")
+                return body.decode('utf-8')
+
+        # Revalidate the cached copy, if any, with a conditional request.
+        headers = dict(HTTP_HEADERS)
+        if meta is not None and meta["status"] == 200:
+            if meta.get("etag"):
+                headers['If-None-Match'] = meta["etag"]
+            if meta.get("last_modified"):
+                headers['If-Modified-Since'] = meta["last_modified"]
+
+        try:
+            status, response_headers, content = http_get(url, headers)
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and body is not None:
+                meta["fetched_at"] = now
+                self._store(url, meta, None)
+                stats.count("cache_revalidated")
+                return body.decode('utf-8')
+            stats.count("cache_misses")
+            print(f"Error fetching {url}: {e}")
+            if e.code == 404:
+                self._store(url, {"url": url, "status": 404, "fetched_at": now}, None)
+                return None
+            # A 5xx or 429 left after the retries is an outage, not a missing page: keep the stale copy.
+            return body.decode('utf-8') if body is not None else None
+        except CircuitOpenError:
+            # The host is down: without a copy to fall back on the run has to stop rather than drop the return type.
+            if body is None:
+                raise
+            stats.count("cache_misses")
+            return body.decode('utf-8')
+        except Exception as e:
+            print(f"Error fetching {url}: {e}")
+            stats.count("cache_misses")
+            # Fall back to the stale copy rather than losing the return type.
+            return body.decode('utf-8') if body is not None else None
+
+        stats.count("cache_misses")
+        self._store(url, {
+            "url": url,
+            "status": 200,
+            "etag": response_headers.get('ETag'),
+            "last_modified": response_headers.get('Last-Modified'),
+            "fetched_at": now
+        }, content)
+        return content.decode('utf-8')
+
+    def evict(self):
+        # Trim the cache back to max_bytes, removing the least recently used entries first.
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(".json"):
+                continue
+            entry_path = entry.path[:-5]
+            size = entry.stat().st_size
+            if os.path.exists(f"{entry_path}.body"):
+                size += os.path.getsize(f"{entry_path}.body")
+            entries.append((entry.stat().st_mtime, entry_path, size))
+            total_size += size
+
+        entries.sort()
+        for last_used, entry_path, size in entries:
+            if total_size <= self.max_bytes:
+                break
+            for suffix in (".json", ".body"):
+                if os.path.exists(f"{entry_path}{suffix}"):
+                    os.remove(f"{entry_path}{suffix}")
+            total_size -= size
+
+
+class HttpDocsSource:
+    # Documentation pages served over HTTP(S), by default from the braincloud-docs GitHub repository.
+
+    def __init__(self, base_url=GITHUB_BASE_URL):
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+
+    def fetch(self, service_name, method_name):
+        url = f"{self.base_url}{service_name}/{method_name}.md"
+
+        if docs_cache is not None:
+            return docs_cache.fetch(url)
+
+        try:
+            # Open the URL with headers and timeout
+            status, response_headers, content = http_get(url, HTTP_HEADERS)
+
+            # Decode the response
+            return content.decode('utf-8')
+
+        # except urllib.error.HTTPError as e:
+        #     # HTTP error (404, 500, etc.)
+        #     print(f"HTTP Error fetching {url}: {e.code} {e.reason}")
+        #     return None
+        # except urllib.error.URLError as e:
+        #     # URL/connection error
+        #     print(f"URL Error fetching {url}: {e.reason}")
+        #     return None
+        # except TimeoutError:
+        #     print(f"Timeout fetching {url}")
+        #     return None
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            # Other exceptions
+            print(f"Error fetching {url}: {e}")
+            return None
+
+
+def docs_index_key(path):
+    # Map a documentation page path onto the lowercased (service, method) pair it documents.
+    # Paths below "2_capi/" are keyed relative to it, so a whole braincloud-docs checkout can be indexed.
+    path = path.replace("\\", "/")
+    if f"/{DOCS_API_FOLDER}/" in f"/{path}":
+        path = f"/{path}".rsplit(f"/{DOCS_API_FOLDER}/", 1)[1]
+    parts = path[:-3].lower().split("/")
+    if len(parts) < 2:
+        return None
+    return parts[-2], parts[-1]
+
+
+class DirectoryDocsSource:
+    # Documentation pages read from a local braincloud-docs checkout (or a copy of its "2_capi" folder).
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                if name.endswith(".md"):
+                    file_path = os.path.join(root, name)
+                    key = docs_index_key(os.path.relpath(file_path, path))
+                    if key is not None and (DOCS_API_FOLDER in file_path or key not in self.index):
+                        self.index[key] = file_path
+
+    def fetch(self, service_name, method_name):
+        file_path = self.index.get((service_name.lower(), method_name.lower()))
+        if file_path is None:
+            print(f"Documentation page not found: {service_name}/{method_name}.md")
+            return None
+        with open(file_path, "r", encoding="utf-8") as md_file:
+            return md_file.read()
+
+
+class TarballDocsSource:
+    # Documentation pages read out of a downloaded braincloud-docs tarball (.tar, .tar.gz, ...).
+    # A compressed archive cannot be seeked into without decompressing it again from the start, so the pages are
+    # read into memory during the single pass that indexes them; they are small next to the rest of the archive.
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+
+        with tarfile.open(path, "r|*") as tar:
+            for member in tar:
+                if member.isfile() and member.name.endswith(".md"):
+                    key = docs_index_key(member.name)
+                    if key is not None and (DOCS_API_FOLDER in member.name or key not in self.index):
+                        self.index[key] = tar.extractfile(member).read()
+
+    def fetch(self, service_name, method_name):
+        md_content = self.index.get((service_name.lower(), method_name.lower()))
+        if md_content is None:
+            print(f"Documentation page not found: {service_name}/{method_name}.md")
+            return None
+        return md_content.decode('utf-8')
+
+
+def open_docs_source(location):
+    # Pick the documentation source from the location: a URL, a local folder or a tarball.
+    if location.startswith("http://") or location.startswith("https://"):
+        return HttpDocsSource(location)
+    if os.path.isdir(location):
+        return DirectoryDocsSource(location)
+    if os.path.isfile(location):
+        return TarballDocsSource(location)
+    raise ValueError(f"Documentation source does not exist: {location}")
+
+
+def fetch_md_content(service_name, method_name):
+    global docs_source
+    if docs_source is None:
+        docs_source = HttpDocsSource()
+    started = time.perf_counter()
+    md_content = docs_source.fetch(service_name, method_name)
+    stats.add_stage("fetch_md_content", time.perf_counter() - started, len(md_content) if md_content else 0)
+    return md_content
+
+
+class DirectoryJsonSource:
+    # Service JSON files read from a folder of the braincloud-portal working tree.
+
+    def __init__(self, path):
+        self.path = path
+
+    def names(self):
+        return [file.name for file in os.scandir(self.path) if file.name.endswith(".json")]
+
+    def read(self, name):
+        with open(f"{self.path}/{name}", "rb") as json_file:
+            return json_file.read()
+
+    def stamp(self, name):
+        # What a file is remembered by in the model snapshot: its mtime and size.
+        stat = os.stat(f"{self.path}/{name}")
+        return stat.st_mtime_ns, stat.st_size
+
+    def close(self):
+        pass
+
+
+class GitJsonSource:
+    # Service JSON files read from a revision of the git repository the source folder belongs to, without a checkout.
+    # The blobs of the folder are listed once, then streamed through a single long-lived "git cat-file --batch".
+
+    def __init__(self, path, revision):
+        self.path = path
+        self.revision = revision
+        self.lock = threading.Lock()
+        try:
+            toplevel, prefix = self.git(path, "rev-parse", "--show-toplevel", "--show-prefix").decode('utf-8').split("\n")[:2]
+            listing = self.git(toplevel, "ls-tree", "-z", f"{revision}:{prefix}")
+        except (OSError, subprocess.CalledProcessError) as e:
+            stderr = getattr(e, "stderr", None)
+            raise ValueError(f"Cannot read {path} at revision {revision}: {stderr.decode('utf-8').strip() if stderr else e}")
+
+        self.blobs = {}
+        for record in listing.split(b"\0"):
+            if record:
+                info, name = record.decode('utf-8').split("\t", 1)
+                mode, kind, sha = info.split(" ")
+                if kind == "blob" and name.endswith(".json"):
+                    self.blobs[name] = sha
+
+        self.process = subprocess.Popen(["git", "-C", toplevel, "cat-file", "--batch"],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    @staticmethod
+    def git(path, *arguments):
+        return subprocess.run(["git", "-C", path, *arguments], check=True, capture_output=True).stdout
+
+    def names(self):
+        return list(self.blobs)
+
+    def stamp(self, name):
+        # Blobs are content addressed, so their id identifies the content exactly.
+        sha = self.blobs.get(name)
+        if sha is None:
+            raise FileNotFoundError(name)
+        return sha
+
+    def read(self, name):
+        sha = self.blobs.get(name)
+        if sha is None:
+            raise FileNotFoundError(name)
+        with self.lock:
+            self.process.stdin.write(f"{sha}\n".encode('ascii'))
+            self.process.stdin.flush()
+            header = self.process.stdout.readline().split()
+            if len(header) != 3:
+                raise FileNotFoundError(name)
+            content = self.process.stdout.read(int(header[2]))
+            self.process.stdout.read(1) # The newline terminating each object
+            return content
+
+    def close(self):
+        # git exits once its stdin is closed, unless a forked process still holds a copy of the pipe.
+        self.process.stdin.close()
+        try:
+            self.process.wait(timeout=GIT_CLOSE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.terminate()
+            self.process.wait()
+        self.process.stdout.close()
+
+
+def open_json_source(path, revision):
+    # Read the service JSON files from the working tree, or from a git revision when one is given.
+    if revision:
+        return GitJsonSource(path, revision)
+    return DirectoryJsonSource(path)
+
+
+def sanitizeMethodName(sourceMethodName):
+    sanitizedMethodName = sourceMethodName.lstrip().rstrip()
+
+    if sanitizedMethodName.find(" ") > -1:
+        sanitizedMethodName = sanitizedMethodName[0:sanitizedMethodName.find(" ")]
+
+    if sanitizedMethodName.find("(") > -1:
+        sanitizedMethodName = sanitizedMethodName[0:sanitizedMethodName.find("(")]
+
+    if sanitizedMethodName.find("{") > -1:
+        sanitizedMethodName = sanitizedMethodName[0:sanitizedMethodName.find("{")]
+
+    if sanitizedMethodName.find("[") > -1:
+        sanitizedMethodName = sanitizedMethodName[0:sanitizedMethodName.find("[")]
+
+    sanitizedMethodName = sanitizedMethodName.lstrip().rstrip()
+
+    if len(sanitizedMethodName) > 0:
+        if len(sanitizedMethodName) > 1:
+            sanitizedMethodName = sanitizedMethodName[0].lower() + sanitizedMethodName[1:]
+        else:
+            sanitizedMethodName = sanitizedMethodName[0].lower()
+
+    return sanitizedMethodName
+
+
+def sanitizeParameterType(sourceParameterType):
+    sanitizedParameterType = sourceParameterType.lstrip().rstrip()
+
+    if sanitizedParameterType.find("|") == -1:
+        sanitizedParameterType = sourceParameterType.lstrip().rstrip().lower()
+
+    if sanitizedParameterType == "string":
+        return "string"
+    elif sanitizedParameterType == "number" or sanitizedParameterType == "integer" or sanitizedParameterType == "int" or sanitizedParameterType == "long" or sanitizedParameterType == "float" or sanitizedParameterType == "double" or sanitizedParameterType == "biginteger":
+        return "number"
+    elif sanitizedParameterType == "boolean" or sanitizedParameterType == "bool":
+        return "boolean"
+    elif sanitizedParameterType == "nativeobject":
+        return "Object"
+    elif sanitizedParameterType == "nativearray":
+        return "Array<any>"
+    elif sanitizedParameterType == "stringarray":
+        return "Array<string>"
+    elif sanitizedParameterType == "numberarray" or sanitizedParameterType == "integerarray" or sanitizedParameterType == "intarray" or sanitizedParameterType == "longarray" or sanitizedParameterType == "floatarray" or sanitizedParameterType == "doublearray" or sanitizedParameterType == "bigintegerarray":
+        return "Array<number>"
+    elif sanitizedParameterType == "booleanarray" or sanitizedParameterType == "boolarray":
+        return "Array<boolean>"
+    elif sanitizedParameterType == "map":
+        return "Map<any, any>"
+    elif sanitizedParameterType == "list":
+        return "Array<any>"
+    else:
+        if sourceParameterType.find("|") > -1:
+            parts = sourceParameterType.split("|")
+
+            multiPartString = ""
+
+            for part in parts:
+                if len(multiPartString) > 0:
+                    multiPartString = multiPartString + " | " + "\"" + part.lstrip().rstrip() + "\""
+                else:
+                    multiPartString = "\"" + part.lstrip().rstrip() + "\""
+
+            return multiPartString
+        else:
+            return sourceParameterType.lstrip().rstrip()
+
+
+class MdDocument:
+    # The parts of a documentation page collected by scan_md_document:
+    # the "JSON Response" blocks, the other fenced blocks as (section, language, code) and the
+    # markdown tables as (section, header cells, rows of cells), each in page order.
+
+    def __init__(self):
+        self.responses = []
+        self.examples = []
+        self.tables = []
+
+
+def split_table_row(line):
+    return [cell.strip() for cell in line.strip().strip("|").split("|")]
+
+
+def is_table_separator(line):
+    return "-" in line and set(line) <= set("|-: ")
+
+
+class MdScanner:
+    # Collects every fenced block and table of a documentation page in a single pass over its lines.
+    # A fenced json block that directly follows <summary>JSON Response</summary> inside <details> is a response,
+    # other fenced blocks are examples labelled with their <TabItem> label (or fence language).
+    # "mdx-code-block" fences only wrap markup (<Tabs>, <TabItem>, ...), so their lines are scanned as markup.
+
+    def __init__(self):
+        self.document = MdDocument()
+        self.section = ""
+        self.summary = None
+        self.after_summary = False
+        self.label = None
+        self.fence = None
+        self.fence_lines = []
+        self.fence_is_response = False
+        self.table = None
+        self.previous_cells = None
+
+    def scan(self, markdown_content):
+        for line in markdown_content.split("\n"):
+            self.scan_line(line)
+        self.end_table()
+        return self.document
+
+    def scan_line(self, line):
+        stripped = line.strip()
+
+        if self.fence is not None:
+            if stripped.startswith("```"):
+                self.end_fence()
+            elif self.fence == "mdx-code-block":
+                self.scan_markup(stripped)
+            else:
+                self.fence_lines.append(line)
+            return
+
+        # Tables are a header row, a separator row and then every following row containing a "|".
+        if self.table is not None:
+            if "|" in stripped:
+                self.table[2].append(split_table_row(stripped))
+                return
+            self.end_table()
+        if self.previous_cells is not None and is_table_separator(stripped):
+            self.table = (self.section, self.previous_cells, [])
+            self.previous_cells = None
+            return
+        self.previous_cells = split_table_row(stripped) if "|" in stripped else None
+
+        if stripped.startswith("```"):
+            self.fence = stripped[3:].strip()
+            self.fence_lines = []
+            self.fence_is_response = self.after_summary and self.summary == "JSON Response" and self.fence == "json"
+            self.after_summary = False
+        elif stripped.startswith("#"):
+            self.section = stripped.lstrip("#").strip()
+            self.after_summary = False
+        elif stripped.startswith("<"):
+            self.scan_markup(stripped)
+        elif stripped:
+            self.after_summary = False
+
+    def scan_markup(self, stripped):
+        if "<details>" in stripped:
+            self.summary = None
+        if "<summary>" in stripped and "</summary>" in stripped:
+            self.summary = stripped[stripped.index("<summary>") + 9:stripped.index("</summary>")].strip()
+            self.after_summary = True
+        elif stripped:
+            self.after_summary = False
+        if "</details>" in stripped:
+            self.summary = None
+        if "<TabItem" in stripped:
+            match = re.search(r'label="([^"]*)"', stripped)
+            self.label = match.group(1) if match else None
+        if "</TabItem>" in stripped:
+            self.label = None
+
+    def end_fence(self):
+        if self.fence != "mdx-code-block":
+            code = "\n".join(self.fence_lines).strip()
+            if self.fence_is_response:
+                self.document.responses.append(code)
+            else:
+                self.document.examples.append((self.section, self.label or self.fence, code))
+        self.fence = None
+
+    def end_table(self):
+        if self.table is not None:
+            self.document.tables.append(self.table)
+            self.table = None
+
+
+def scan_md_document(markdown_content):
+    return MdScanner().scan(markdown_content)
+
+
+def extract_json_response(markdown_content):
+    # Find the first JSON response block within the markdown
+    document = scan_md_document(markdown_content)
+    if document.responses:
+        json_str = document.responses[0]
+        try:
+            return json.loads(json_str)
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON: {e} in {json_str}")
+            return None
+    return None
+
+
+# Inferred types are tuples: ("string",), ("number",), ("boolean",), ("null",), ("any",), ("empty",) for the
+# element of an empty array, ("record",) for an object beyond MAX_DEPTH_FOR_TYPE_GENERATION,
+# ("array", element), ("object", ((key, type, optional), ...)) and ("union", (type, ...)).
+# ("ref", name) stands for an object type hoisted into lib.cloudcode.response-types.d.ts by the ShapeRegistry.
+STRING_TYPE = ("string",)
+NUMBER_TYPE = ("number",)
+BOOLEAN_TYPE = ("boolean",)
+NULL_TYPE = ("null",)
+ANY_TYPE = ("any",)
+EMPTY_TYPE = ("empty",)
+RECORD_TYPE = ("record",)
+
+
+class TypeInference:
+    # Infers the structural type of a JSON example, merging the shapes of all array elements.
+    # The work is bounded: at most max_nodes values are visited and at most sample_size elements of an array,
+    # anything past the budget becomes "any". Types are interned, so identical subtrees are shared
+    # and merging them is memoized.
+
+    def __init__(self, max_nodes=INFERENCE_MAX_NODES, sample_size=INFERENCE_ARRAY_SAMPLE_SIZE, max_depth=MAX_DEPTH_FOR_TYPE_GENERATION):
+        self.remaining = max_nodes
+        self.sample_size = sample_size
+        self.max_depth = max_depth
+        self.interned = {}
+        self.merged = {}
+
+    def intern(self, inferred):
+        return self.interned.setdefault(inferred, inferred)
+
+    def infer(self, value, depth=0):
+        if self.remaining <= 0:
+            return ANY_TYPE
+        self.remaining -= 1
+
+        # bool is a subclass of int, so it has to be checked first.
+        if value is None:
+            return NULL_TYPE
+        if isinstance(value, bool):
+            return BOOLEAN_TYPE
+        if isinstance(value, (int, float)):
+            return NUMBER_TYPE
+        if isinstance(value, str):
+            return STRING_TYPE
+        if isinstance(value, dict):
+            if depth > self.max_depth - 1:
+                return RECORD_TYPE
+            # Keys are normalized to identifiers here, keys that collapse onto the same identifier are merged.
+            # A key with nothing left of it (made only of punctuation) is kept as a quoted property name instead.
+            fields = {}
+            for key, item in value.items():
+                sanitized_key = re.sub(r'[^a-zA-Z0-9_]', '', key) or json.dumps(key)
+                item_type = self.infer(item, depth + 1)
+                fields[sanitized_key] = self.merge(fields[sanitized_key], item_type) if sanitized_key in fields else item_type
+            return self.intern(("object", tuple((key, field_type, False) for key, field_type in fields.items())))
+        if isinstance(value, list):
+            element = EMPTY_TYPE
+            for item in self.sample(value):
+                element = self.merge(element, self.infer(item, depth))
+            return self.intern(("array", element))
+        return ANY_TYPE
+
+    def sample(self, items):
+        # Inspect evenly spaced elements of huge arrays rather than all of them.
+        if len(items) <= self.sample_size:
+            return items
+        step = len(items) / self.sample_size
+        return [items[int(index * step)] for index in range(self.sample_size)]
+
+    def merge(self, first, second):
+        if first is second or first == second:
+            return first
+        if first is EMPTY_TYPE:
+            return second
+        if second is EMPTY_TYPE:
+            return first
+        if first is ANY_TYPE or second is ANY_TYPE:
+            return ANY_TYPE
+
+        key = (id(first), id(second))
+        merged = self.merged.get(key)
+        if merged is None:
+            merged = self.intern(self._merge(first, second))
+            self.merged[key] = merged
+        return merged
+
+    def _merge(self, first, second):
+        if first[0] == "object" and second[0] == "object":
+            # Fields missing from one of the shapes become optional.
+            second_fields = {key: (field_type, optional) for key, field_type, optional in second[1]}
+            fields = []
+            for key, field_type, optional in first[1]:
+                if key in second_fields:
+                    other_type, other_optional = second_fields.pop(key)
+                    fields.append((key, self.merge(field_type, other_type), optional or other_optional))
+                else:
+                    fields.append((key, field_type, True))
+            for key, field_type, optional in second[1]:
+                if key in second_fields:
+                    fields.append((key, field_type, True))
+            return ("object", tuple(fields))
+        if first[0] == "array" and second[0] == "array":
+            return ("array", self.merge(first[1], second[1]))
+        if {first[0], second[0]} == {"object", "record"}:
+            return RECORD_TYPE
+
+        # Anything else becomes a union, with at most one object/record and one array member.
+        members = []
+        for member in (first[1] if first[0] == "union" else (first,)) + (second[1] if second[0] == "union" else (second,)):
+            slot = union_slot(member)
+            for index, existing in enumerate(members):
+                if existing == member or (slot is not None and union_slot(existing) == slot):
+                    members[index] = self.merge(existing, member)
+                    break
+            else:
+                members.append(member)
+        if len(members) == 1:
+            return members[0]
+        return ("union", tuple(members))
+
+
+def union_slot(inferred):
+    # Objects and records share one slot of a union, and so do arrays; their shapes get merged instead.
+    if inferred[0] in ("object", "record"):
+        return "object"
+    if inferred[0] == "array":
+        return "array"
+    return None
+
+
+def infer_json_type(json_obj):
+    return TypeInference().infer(json_obj)
+
+
+def emit_type(inferred, current_indent, out):
+    # Append the TypeScript for an inferred type to "out"; the caller joins the pieces once at the end.
+    kind = inferred[0]
+    if kind == "object":
+        out.append("{\n")
+        emit_type_members(inferred, current_indent + "    ", out)
+        out.append(f"{current_indent}}}")
+    elif kind == "array":
+        out.append("Array<")
+        emit_type(inferred[1], current_indent, out)
+        out.append(">")
+    elif kind == "union":
+        members = [member for member in inferred[1] if member is not NULL_TYPE and member != NULL_TYPE]
+        for index, member in enumerate(members):
+            if index > 0:
+                out.append(" | ")
+            emit_type(member, current_indent, out)
+        if len(members) < len(inferred[1]):
+            out.append(" | null")
+    elif kind == "null":
+        out.append("any | null")
+    elif kind == "record":
+        out.append("Record<string, any>")
+    elif kind == "empty":
+        out.append("any")
+    elif kind == "ref":
+        out.append(inferred[1])
+    else:
+        out.append(kind)
+
+
+def emit_type_members(inferred, current_indent, out):
+    for key, field_type, optional in inferred[1]:
+        out.append(f"{current_indent}{key}{'?' if optional else ''}: ")
+        emit_type(field_type, current_indent, out)
+        out.append(";\n")
+
+
+def build_registry(interfaces):
+    # Collect the return types of every service interface and name the ones that get hoisted.
+    registry = ShapeRegistry()
+    for interface in interfaces:
+        for method in interface.methods:
+            if method.return_type is not None:
+                registry.add(method.return_type)
+    registry.assign_names()
+    return registry
+
+
+class ShapeRegistry:
+    # Collects the inferred return types of every service and hoists each object type that would be rendered
+    # more than once into a named interface of lib.cloudcode.response-types.d.ts.
+    # Names combine the PascalCase field name with a hash of the shape, so they are stable between runs.
+
+    def __init__(self):
+        self.counts = {}
+        self.keys = {}
+        self.names = {}
+        self.hoisted = {}
+
+    def add(self, inferred, key="response"):
+        kind = inferred[0]
+        if kind == "object":
+            # A shape is only rendered once, so the shapes inside it are only counted the first time it is seen.
+            seen = inferred in self.counts
+            self.counts[inferred] = self.counts.get(inferred, 0) + 1
+            self.keys[inferred] = min(key, self.keys.get(inferred, key))
+            if not seen:
+                for field_key, field_type, optional in inferred[1]:
+                    self.add(field_type, field_key)
+        elif kind == "array":
+            self.add(inferred[1], key)
+        elif kind == "union":
+            for member in inferred[1]:
+                self.add(member, key)
+
+    def assign_names(self):
+        for inferred, count in self.counts.items():
+            if count > 1 and inferred[1]:
+                key = re.sub(r'[^a-zA-Z0-9_]', '', self.keys[inferred]) # Quoted keys are made only of punctuation
+                name = key[:1].upper() + key[1:] or "Type"
+                if not name[0].isalpha():
+                    name = "T" + name
+                self.names[inferred] = f"{name}_{hashlib.sha1(repr(inferred).encode('utf-8')).hexdigest()[:8]}"
+
+    def hoist(self, inferred, top=True):
+        # Replace the hoisted object types below (and including, unless top is False) this type with references.
+        if top and inferred in self.names:
+            return ("ref", self.names[inferred])
+
+        kind = inferred[0]
+        if kind == "object":
+            hoisted = self.hoisted.get(inferred)
+            if hoisted is None:
+                hoisted = ("object", tuple((key, self.hoist(field_type), optional) for key, field_type, optional in inferred[1]))
+                self.hoisted[inferred] = hoisted
+            return hoisted
+        if kind == "array":
+            return ("array", self.hoist(inferred[1]))
+        if kind == "union":
+            return ("union", tuple(self.hoist(member) for member in inferred[1]))
+        return inferred
+
+    def hoist_interface(self, interface):
+        # Return a copy of the interface referencing the hoisted types; the original keeps its inferred types.
+        methods = [DtsMethod(method.name, method.desc, method.params,
+                             self.hoist(method.return_type) if method.return_type is not None else None)
+                   for method in interface.methods]
+        return DtsInterface(interface.name, methods, interface.separate_last)
+
+    def named_types(self):
+        # The hoisted object types in name order, as (name, type referencing the other hoisted types).
+        return [(name, self.hoist(inferred, top=False)) for name, inferred in
+                sorted((name, inferred) for inferred, name in self.names.items())]
+
+    def render(self):
+        # Render the "lib.cloudcode.response-types.d.ts" content, one interface per hoisted object type.
+        out = ['/// <reference no-default-lib="true"/>\n\n']
+        for index, (name, inferred) in enumerate(self.named_types()):
+            if index > 0:
+                out.append('\n\n')
+            out.append(f'interface {name} {{\n')
+            emit_type_members(inferred, '\t', out)
+            out.append('}')
+        return "".join(out)
+
+
+def collect_operations(service_name, operations):
+    # Filter the operations of a service down to the ones that get rendered, in source order.
+    collected = []
+    processed_methods = set()
+
+    for method in operations:
+        method_name = sanitizeMethodName(method["apiMethod"])
+
+        # If the method name for the operation is an empty string, ignore it.
+        if len(method_name.lstrip().rstrip()) == 0:
+            continue
+
+        # Check if the method is excluded for this service
+        if service_name in EXCLUDED_METHODS and method_name in EXCLUDED_METHODS[service_name]:
+            continue
+
+        # There are aliases defined in the source JSON, so we only want to process the first occurance.
+        if method_name in processed_methods:
+            continue
+
+        processed_methods.add(method_name)
+        collected.append((method_name, method))
+
+    return collected
+
+
+class ServiceModel:
+    # A service JSON file normalized once: the operations that get rendered, with their names sanitized,
+    # aliases and excluded methods dropped and parameter types mapped to TypeScript.
+
+    __slots__ = ("name", "output_file", "operations", "operation_count", "source_hash")
+
+    def __init__(self, name, operations, operation_count, source_hash, output_file=None):
+        self.name = name
+        self.output_file = output_file or sys.intern(service_output_file(name))
+        self.operations = operations
+        self.operation_count = operation_count
+        self.source_hash = source_hash
+
+    def __reduce__(self):
+        # Pickled as constructor arguments, which loads about twice as fast as the default state dict of each object.
+        return ServiceModel, (self.name, self.operations, self.operation_count, self.source_hash, self.output_file)
+
+
+class OperationModel:
+    # An operation of a service: the sanitized method name, the API method its documentation page is named after,
+    # its description and its parameters (DtsParam, as rendered).
+
+    __slots__ = ("name", "api_method", "desc", "params")
+
+    def __init__(self, name, api_method, desc, params):
+        self.name = name
+        self.api_method = api_method
+        self.desc = desc
+        self.params = params
+
+    def __reduce__(self):
+        return OperationModel, (self.name, self.api_method, self.desc, self.params)
+
+
+def intern_text(text):
+    return sys.intern(text) if isinstance(text, str) else text
+
+
+def normalize_service(source, source_hash):
+    # Parse a service JSON file into its ServiceModel. Names, types and descriptions repeat across services,
+    # so they are interned and shared by every model (and by a pickled snapshot of them).
+    data = json.loads(source)
+    service_name = sys.intern(data["serviceName"])
+    operations = []
+    for method_name, method in collect_operations(service_name, data["operations"]):
+        params = []
+        for param in method.get("paramInfo", []):
+            if "type" not in param:
+                print(f'{service_name}.json - Parameter <{param.get("name")}> of {method_name} missing "paramInfo.type", skipped.')
+                continue
+            params.append(DtsParam(sys.intern(param["name"]), sys.intern(sanitizeParameterType(param["type"])),
+                                   intern_text(param.get("desc"))))
+        params = tuple(params)
+        operations.append(OperationModel(sys.intern(method_name), sys.intern(method["apiMethod"]),
+                                         intern_text(method["desc"]), params))
+    return ServiceModel(service_name, tuple(operations), len(data["operations"]), source_hash)
+
+
+def load_model_snapshot(target_path, settings):
+    # The models of the previous run, as proxy -> (file stamp, ServiceModel), and the return types it inferred,
+    # as page hash -> inferred type, if they were normalized with these settings.
+    # The snapshot holds a great many small objects, which would set the cyclic garbage collector off over and over
+    # while they are created; pausing it makes loading several times faster.
+    gc_enabled = gc.isenabled()
+    try:
+        with open(f"{target_path}/{MODEL_SNAPSHOT_FILE_NAME}", "rb") as snapshot_file:
+            content = snapshot_file.read()
+        gc.disable()
+        snapshot = pickle.loads(content)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError):
+        return {}, {}
+    finally:
+        if gc_enabled:
+            gc.enable()
+    if not isinstance(snapshot, dict) or snapshot.get("version") != MODEL_SNAPSHOT_VERSION or snapshot.get("settings") != settings:
+        return {}, {}
+    return snapshot["services"], snapshot["return_types"]
+
+
+def save_model_snapshot(target_path, settings, services, return_types):
+    content = pickle.dumps({"version": MODEL_SNAPSHOT_VERSION, "settings": settings, "services": services,
+                            "return_types": return_types}, protocol=5)
+    write_if_changed(f"{target_path}/{MODEL_SNAPSHOT_FILE_NAME}", content)
+
+
+def prefetch_md_contents(executor, service, pages=None):
+    # Queue the documentation fetch of every operation ahead of rendering.
+    # The futures are returned in operation order so the renderer can consume them as they complete.
+    # Pages already queued in "pages" ((service, method) -> future) are not fetched again.
+    pages = {} if pages is None else pages
+    futures = []
+    for operation in service.operations:
+        key = (service.name.lower(), operation.api_method.lower())
+        if key not in pages:
+            pages[key] = executor.submit(fetch_md_content, *key)
+        futures.append(pages[key])
+    return futures
+
+
+def service_proxy_name(service_name):
+    # Massage the service name into an appropriate proxy name (used as part of the output file name).
+    return re.sub(r'(?<!^)(?=[A-Z])', '-',
+                  re.sub(r'^([A-Z0-9]+(?![a-z0-9]))(.*)$', lambda pat: pat.group(1).lower() + pat.group(2),
+                         service_name)).lower()
+
+
+class DtsParam:
+    # A method parameter, documented with a JSDoc "@param" line when it has a description.
+
+    __slots__ = ("name", "type", "desc")
+
+    def __init__(self, name, type, desc):
+        self.name = name
+        self.type = type
+        self.desc = desc
+
+    def __reduce__(self):
+        return DtsParam, (self.name, self.type, self.desc)
+
+
+class DtsMethod:
+    # A method of a proxy interface: its JSDoc description, parameters and inferred return type.
+    # A return type of None (or an empty object) is rendered as the generic "ServiceProxyResponse".
+
+    __slots__ = ("name", "desc", "params", "return_type")
+
+    def __init__(self, name, desc, params, return_type):
+        self.name = name
+        self.desc = desc
+        self.params = params
+        self.return_type = return_type
+
+
+class DtsInterface:
+    # A proxy interface. "separate_last" keeps the historic blank line after the last method,
+    # which is only left out when no operation of the service was skipped.
+
+    __slots__ = ("name", "methods", "separate_last")
+
+    def __init__(self, name, methods, separate_last):
+        self.name = name
+        self.methods = methods
+        self.separate_last = separate_last
+
+
+def build_service_interface(service, md_contents, return_types=None):
+    # Turn a service and the documentation of its operations into the DtsInterface to render.
+    # Pass the same "return_types" (documentation page hash -> inferred return type) to several calls of a run
+    # to infer a page shared by aliases, services or versions once, or keep it in the model snapshot for the next run.
+    return_types = {} if return_types is None else return_types
+    service_name = service.name
+    methods = []
+
+    for operation, md_content in zip(service.operations, md_contents):
+        return_type = None
+        page_hash = content_hash(md_content) if md_content else None
+        if page_hash in return_types:
+            return_type = return_types[page_hash]
+            stats.count("return_types_reused")
+        elif md_content:
+            with stats.stage("extract_json_response", len(md_content)):
+                json_response = extract_json_response(md_content)
+            if json_response:
+                with stats.stage("infer_json_type"):
+                    return_type = infer_json_type(json_response)
+            return_types[page_hash] = return_type
+
+        for param in operation.params:
+            if param.desc is None:
+                print(f'{service_name}.json - Parameter <{param.name}> missing "paramInfo.desc".')
+
+        method_name = operation.name
+        if method_name == "createGroupWithSummaryData":
+            method_name = "createGroup"
+
+        methods.append(DtsMethod(method_name, operation.desc, list(operation.params), return_type))
+
+    return DtsInterface(f"{service_name}ServiceProxy", methods, len(methods) < service.operation_count)
+
+
+def emit_method(method, out):
+    # Process the comments/jsdoc section, this contains a method description along with parameter descriptions.
+    out.append(f'\t/**\n\t * {method.desc}\n\t * \n')
+    for param in method.params:
+        if param.desc is not None:
+            out.append(f'\t * @param  {{{param.type}}} {param.name} {param.desc}\n')
+    out.append(f'\t * @returns ServiceProxyResponse\n\t */ \n')
+
+    out.append(f'\t{method.name}(')
+    out.append(", ".join(f'{param.name}: {param.type}' for param in method.params))
+    out.append('): ')
+
+    if method.return_type is not None and method.return_type[0] == "object" and method.return_type[1]:
+        # Start inner content with 2 tabs, nested objects add 4 spaces per level.
+        out.append('{\n')
+        emit_type_members(method.return_type, '\t\t', out)
+        out.append('\t};\n')
+    elif method.return_type is not None and method.return_type[0] != "object":
+        emit_type(method.return_type, '\t', out)
+        out.append(';\n')
+    else:
+        out.append('ServiceProxyResponse;\n')
+
+    out.append('\n') # Ensure a single newline separates methods
+
+
+def emit_interface(interface, out):
+    out.append(f'interface {interface.name} {{\n')
+    for index, method in enumerate(interface.methods):
+        emit_method(method, out)
+        if index < len(interface.methods) - 1 or interface.separate_last:
+            out.append('\n')
+    out.append('}')
+
+
+def render_service_interface(interface):
+    # Render the "lib.cloudcode.<proxy>-service-proxy.d.ts" content of a service.
+    out = ['/// <reference no-default-lib="true"/>\n\n']
+    emit_interface(interface, out)
+    return "".join(out)
+
+
+def service_output_file(service_name):
+    return f"lib.cloudcode.{service_proxy_name(service_name)}-service-proxy.d.ts"
+
+
+def render_service_proxy(service, md_contents):
+    # Render a single service on its own, with every return type inlined.
+    return render_service_interface(build_service_interface(service, md_contents))
+
+
+def render_service_proxies_entry(service_name):
+    # Render the "get<XXX>ServiceProxy" function definition of a service for the "lib.cloudcode.service-proxies.d.ts" file.
+    return (f'\t/**\n'
+            f'\t * Retrieves a {service_name}Service proxy object.\n'
+            f'\t * \n'
+            f'\t * @param session A optional parameter for when a script is executed without a session.\n'
+            f'\t */ \n'
+            f'\tget{service_name}ServiceProxy(session?: string): {service_name}ServiceProxy;\n\n')
+
+
+def completion_type_label(inferred):
+    # The type of a completion item as it reads in the typings, with inline object types shortened to "object".
+    kind = inferred[0]
+    if kind == "object":
+        return "object"
+    if kind == "array":
+        return f"Array<{completion_type_label(inferred[1])}>"
+    if kind == "union":
+        return " | ".join(completion_type_label(member) for member in inferred[1] if member[0] != "null") + \
+            (" | null" if any(member[0] == "null" for member in inferred[1]) else "")
+    out = []
+    emit_type(inferred, "", out)
+    return "".join(out)
+
+
+def completion_members(inferred):
+    # The members of an object type (or of the objects in an array type) as [name, type, optional, members],
+    # the members being those of the member's own object type, if any. Hoisted types are referenced by name.
+    while inferred[0] == "array":
+        inferred = inferred[1]
+    if inferred[0] != "object":
+        return []
+    return [[key, completion_type_label(field_type), optional, completion_members(field_type)]
+            for key, field_type, optional in inferred[1]]
+
+
+def build_completion_entry(service_name, interface):
+    # The completion index entry of a service, from the same interface (with hoisted types) its typings render from.
+    methods = []
+    for method in interface.methods:
+        return_type = method.return_type
+        if return_type is None or (return_type[0] == "object" and not return_type[1]):
+            returns, members = "ServiceProxyResponse", []
+        else:
+            returns, members = completion_type_label(return_type), completion_members(return_type)
+        methods.append({
+            "name": method.name,
+            "doc": method.desc,
+            "params": [[param.name, param.type, param.desc] for param in method.params],
+            "returns": returns,
+            "members": members
+        })
+    return {"service": service_name, "getter": f"get{service_name}ServiceProxy", "interface": interface.name,
+            "methods": methods}
+
+
+def render_completion_index(entries, registry):
+    # Render the "lib.cloudcode.completions.json" content: every service with its methods, their JSDoc, parameters and
+    # return type members, plus the members of the hoisted response types (if any, else registry is None),
+    # so completions need no typings parsed.
+    return json.dumps({
+        "version": COMPLETION_INDEX_VERSION,
+        "services": entries,
+        "types": {name: completion_members(inferred) for name, inferred in registry.named_types()} if registry is not None else {}
+    }, separators=(",", ":"))
+
+
+def render_service_proxies(service_names):
+    # Render the "lib.cloudcode.service-proxies.d.ts" content of every service, in order.
+    # This contains the "get<XXX>ServiceProxy" function definitions that are applied to the main Bridge interface.
+    entries = [render_service_proxies_entry(service_name) for service_name in service_names]
+    return '/// <reference no-default-lib="true"/>\n\n' + 'interface ServiceProxies {\n' + "".join(entries) + '}'
+
+
+DTS_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>[ \t\r\n]+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<identifier>[A-Za-z_$][A-Za-z0-9_$]*)
+  | (?P<number>\d+(?:\.\d+)?(?![A-Za-z_$]))
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<punctuation>[{}()<>\[\];:,|?])
+""", re.VERBOSE | re.DOTALL)
+
+DTS_RESERVED_WORDS = {
+    "break", "case", "catch", "class", "const", "continue", "debugger", "default", "delete", "do", "else", "enum",
+    "export", "extends", "false", "finally", "for", "function", "if", "import", "in", "instanceof", "new", "null",
+    "return", "super", "switch", "this", "throw", "true", "try", "typeof", "var", "void", "while", "with"
+}
+
+
+class DtsSyntaxError(Exception):
+    pass
+
+
+def tokenize_dts(content):
+    # Yield the (kind, text, line, column) tokens of a declaration file, skipping whitespace and comments.
+    position = 0
+    line = 1
+    line_start = 0
+    while position < len(content):
+        match = DTS_TOKEN_PATTERN.match(content, position)
+        if match is None:
+            if content.startswith("/*", position):
+                raise DtsSyntaxError(f"{line}:{position - line_start + 1}: unterminated comment")
+            raise DtsSyntaxError(f"{line}:{position - line_start + 1}: unexpected character {content[position]!r}")
+        kind = match.lastgroup
+        if kind not in ("space", "comment"):
+            yield kind, match.group(), line, position - line_start + 1
+        newlines = content.count("\n", position, match.end())
+        if newlines:
+            line += newlines
+            line_start = content.rindex("\n", position, match.end()) + 1
+        position = match.end()
+    yield "end", "", line, position - line_start + 1
+
+
+class DtsValidator:
+    # Streaming recursive-descent check of the declaration subset the generator emits:
+    # interfaces of methods and properties whose types are names (with type arguments), string literals,
+    # object types, arrays and unions. Syntax errors stop the file, other problems are collected as they are found.
+
+    def __init__(self, content):
+        self.tokens = tokenize_dts(content)
+        self.token = next(self.tokens)
+        self.diagnostics = []
+
+    def advance(self):
+        token = self.token
+        self.token = next(self.tokens)
+        return token
+
+    def fail(self, message, token=None):
+        kind, text, line, column = token or self.token
+        raise DtsSyntaxError(f"{line}:{column}: {message}, found {text!r}" if kind != "end" else f"{line}:{column}: {message}, found end of file")
+
+    def warn(self, message, token):
+        self.diagnostics.append(f"{token[2]}:{token[3]}: {message}")
+
+    def expect(self, text):
+        if self.token[1] != text:
+            self.fail(f"expected {text!r}")
+        return self.advance()
+
+    def validate(self):
+        try:
+            while self.token[0] != "end":
+                if self.token[1] != "interface":
+                    self.fail("expected 'interface'")
+                self.advance()
+                if self.token[0] != "identifier":
+                    self.fail("expected an interface name")
+                self.advance()
+                self.object_type(methods=True)
+        except DtsSyntaxError as e:
+            self.diagnostics.append(str(e))
+        return self.diagnostics
+
+    def object_type(self, methods):
+        self.expect("{")
+        names = set()
+        while self.token[1] != "}":
+            name = self.token
+            if name[0] in ("identifier", "number", "string"):
+                self.advance()
+            else:
+                self.fail("expected a member name")
+            if self.token[1] == "?":
+                self.advance()
+            if methods and self.token[1] == "(":
+                self.parameters()
+            elif name[1] in names:
+                self.warn(f"duplicate member {name[1]!r}", name)
+            names.add(name[1])
+            self.expect(":")
+            self.type()
+            self.expect(";")
+        self.advance()
+
+    def parameters(self):
+        self.expect("(")
+        while self.token[1] != ")":
+            name = self.token
+            if name[0] != "identifier":
+                self.fail("expected a parameter name")
+            if name[1] in DTS_RESERVED_WORDS:
+                self.warn(f"reserved word {name[1]!r} used as a parameter name", name)
+            self.advance()
+            if self.token[1] == "?":
+                self.advance()
+            self.expect(":")
+            self.type()
+            if self.token[1] != ")":
+                self.expect(",")
+        self.advance()
+
+    def type(self):
+        self.primary_type()
+        while self.token[1] == "|":
+            self.advance()
+            self.primary_type()
+
+    def primary_type(self):
+        kind, text = self.token[0], self.token[1]
+        if kind == "identifier":
+            self.advance()
+            if self.token[1] == "<":
+                self.advance()
+                self.type()
+                while self.token[1] == ",":
+                    self.advance()
+                    self.type()
+                self.expect(">")
+        elif kind in ("string", "number"):
+            self.advance()
+        elif text == "{":
+            self.object_type(methods=False)
+        elif text == "(":
+            self.advance()
+            self.type()
+            self.expect(")")
+        else:
+            self.fail("expected a type")
+        while self.token[1] == "[":
+            self.advance()
+            self.expect("]")
+
+
+def validate_dts(content):
+    # Return the "line:column: message" diagnostics of a generated declaration file.
+    return DtsValidator(content).validate()
+
+
+def report_diagnostics(output_file, diagnostics):
+    for diagnostic in diagnostics:
+        print(f"{output_file}:{diagnostic}")
+    stats.count("validation_errors", len(diagnostics))
+
+
+def build_service_job(service, md_contents):
+    # Build the interface of a service in a worker process (see iter_interfaces), sending the instrumentation
+    # of the job back to the parent.
+    stats.reset()
+    interface = build_service_interface(service, md_contents)
+    return interface, stats.snapshot()
+
+
+def render_service_job(interface, validate, in_worker):
+    # Render a service and fingerprint its methods, and validate the rendered file if asked to;
+    # runs in a worker process when render_outputs is given an executor.
+    if in_worker:
+        stats.reset()
+    with stats.stage("render"):
+        content = render_service_interface(interface)
+        fingerprints = interface_fingerprints(interface)
+    diagnostics = []
+    if validate:
+        with stats.stage("validate", len(content)):
+            diagnostics = validate_dts(content)
+    return content, fingerprints, diagnostics, stats.snapshot() if in_worker else None
+
+
+def interface_fingerprints(interface):
+    # Fingerprint each method by its rendered JSDoc, parameters and return type. Hoisted return types are named
+    # after a hash of their shape, so a method whose shared type changed gets a new fingerprint as well.
+    fingerprints = {}
+    for method in interface.methods:
+        out = []
+        emit_method(method, out)
+        fingerprints[method.name] = content_hash("".join(out))
+    return fingerprints
+
+
+def load_signature_index(path):
+    try:
+        with open(path, "r") as index_file:
+            index = json.load(index_file)
+    except (OSError, ValueError) as e:
+        print(f"Error reading the previous signature index {path}: {e}")
+        return None
+    if index.get("version") != SIGNATURE_INDEX_VERSION:
+        print(f"Unsupported signature index version in {path}: {index.get('version')}")
+        return None
+    return index
+
+
+def diff_signature_indexes(previous, current):
+    # List the added, removed and changed methods of each interface, plus the declaration files
+    # that were regenerated or removed since the previous run.
+    interfaces = {}
+    for service_name in sorted(set(previous["services"]) | set(current["services"])):
+        old = previous["services"].get(service_name, {}).get("methods", {})
+        new = current["services"].get(service_name, {}).get("methods", {})
+        delta = {
+            "added": sorted(name for name in new if name not in old),
+            "removed": sorted(name for name in old if name not in new),
+            "changed": sorted(name for name in new if name in old and new[name] != old[name])
+        }
+        if delta["added"] or delta["removed"] or delta["changed"]:
+            interfaces[f"{service_name}ServiceProxy"] = delta
+    return {
+        "version": SIGNATURE_INDEX_VERSION,
+        "interfaces": interfaces,
+        "files": sorted(name for name, file_hash in current["files"].items() if previous["files"].get(name) != file_hash),
+        "removed_files": sorted(name for name in previous["files"] if name not in current["files"])
+    }
+
+
+def content_hash(content):
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+def settings_hash():
+    # Hash everything besides the inputs that affects the generated output, including the generator itself.
+    with open(__file__, "rb") as generator_file:
+        generator = generator_file.read()
+    return content_hash(json.dumps({
+        "EXCLUDED_METHODS": EXCLUDED_METHODS,
+        "EXCLUDED_SERVICES": EXCLUDED_SERVICES,
+        "MAX_DEPTH_FOR_TYPE_GENERATION": MAX_DEPTH_FOR_TYPE_GENERATION,
+        "INFERENCE_MAX_NODES": INFERENCE_MAX_NODES,
+        "INFERENCE_ARRAY_SAMPLE_SIZE": INFERENCE_ARRAY_SAMPLE_SIZE,
+        "generator": content_hash(generator)
+    }, sort_keys=True))
+
+
+def load_manifest(target_path):
+    try:
+        with open(f"{target_path}/{MANIFEST_FILE_NAME}", "r") as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def write_if_changed(path, content):
+    # Only (re)write the file when its content differs, so unchanged outputs keep their mtime.
+    # Text is written in text mode like before, bytes (compressed outputs) as is.
+    binary = "b" if isinstance(content, bytes) else ""
+    with stats.stage("write", len(content)):
+        try:
+            with open(path, "r" + binary) as existing:
+                if existing.read() == content:
+                    return False
+        except (OSError, UnicodeDecodeError):
+            pass
+        with open(path, "w" + binary) as file:
+            file.write(content)
+        stats.count("files_written")
+        return True
+
+
+def render_bundle(file_names, contents):
+    # Concatenate the outputs into one blob, separated by newlines, with an index of
+    # name -> byte offset, byte length and sha256 so single files can be sliced out without parsing the rest.
+    parts = []
+    index = {}
+    offset = 0
+    for name in file_names:
+        data = contents[name].encode('utf-8')
+        index[name] = {"offset": offset, "length": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+        parts.append(data)
+        parts.append(b"\n")
+        offset += len(data) + 1
+    return b"".join(parts), index
+
+
+def hashed_file_name(name, data):
+    # "lib.cloudcode.friend-service-proxy.d.ts" -> "lib.cloudcode.friend-service-proxy.<sha256 prefix>.d.ts"
+    digest = hashlib.sha256(data).hexdigest()[:ASSET_HASH_LENGTH]
+    extension = ".d.ts" if name.endswith(".d.ts") else os.path.splitext(name)[1]
+    return f"{name[:len(name) - len(extension)]}.{digest}{extension}"
+
+
+def render_asset(name, data):
+    # The content-addressed copy of an output and its precompressed variants, as (file name, content) pairs,
+    # and the entry of the output in the assets manifest: the copy, its size and its SRI hash, and the variants.
+    file_name = hashed_file_name(name, data)
+    files = [(file_name, data)]
+    entry = {"file": file_name, "size": len(data),
+             "integrity": "sha384-" + base64.b64encode(hashlib.sha384(data).digest()).decode('ascii'), "encodings": {}}
+    for encoding, extension, compress in ASSET_ENCODINGS:
+        compressed = compress(data)
+        files.append((file_name + extension, compressed))
+        entry["encodings"][encoding] = {"file": file_name + extension, "size": len(compressed)}
+    return files, entry
+
+
+def asset_files(entry):
+    return [entry["file"]] + [encoded["file"] for encoded in entry["encodings"].values()]
+
+
+def load_assets(target_path):
+    try:
+        with open(f"{target_path}/{ASSETS_FILE_NAME}", "r") as assets_file:
+            assets = json.load(assets_file)
+    except (OSError, ValueError):
+        return {}
+    if assets.get("version") != ASSETS_VERSION:
+        return {}
+    return assets["files"]
+
+
+class InotifyWatcher:
+    # Reports the names of the files changed in a folder, using Linux inotify through libc.
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), INOTIFY_MASK) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+
+    def wait(self, timeout):
+        # Block for up to timeout seconds (forever when None) and return the changed file names.
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        names = set()
+        offset = 0
+        while offset + 16 <= len(data):
+            wd, mask, cookie, length = struct.unpack_from("iIII", data, offset)
+            names.add(os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b"\0")))
+            offset += 16 + length
+        return names
+
+
+class PollingWatcher:
+    # Reports the names of the files changed in a folder by comparing their mtime and size every WATCH_POLL_INTERVAL.
+
+    def __init__(self, path):
+        self.path = path
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for entry in os.scandir(self.path):
+            if entry.is_file():
+                stat = entry.stat()
+                snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            time.sleep(WATCH_POLL_INTERVAL if deadline is None else max(0, min(WATCH_POLL_INTERVAL, deadline - time.monotonic())))
+            snapshot = self.scan()
+            names = {name for name in snapshot.keys() | self.snapshot.keys() if snapshot.get(name) != self.snapshot.get(name)}
+            self.snapshot = snapshot
+            if names or (deadline is not None and time.monotonic() >= deadline):
+                return names
+
+
+def open_watcher(path):
+    try:
+        return InotifyWatcher(path)
+    except (OSError, AttributeError, TypeError):
+        print("inotify is not available, polling for changes instead.")
+        return PollingWatcher(path)
+
+
+def wait_for_changes(watcher):
+    # Wait for a change, then keep collecting changes until none arrived for WATCH_DEBOUNCE seconds,
+    # so an editor saving several files (or one file several times) triggers a single regeneration.
+    changed = watcher.wait(None)
+    while True:
+        more = watcher.wait(WATCH_DEBOUNCE)
+        if not more:
+            return changed
+        changed |= more
+
+
+class LruCache:
+    # A bounded mapping that forgets the least recently used entry first, and entries older than max_age seconds
+    # if given; safe to share between threads.
+
+    def __init__(self, max_entries, max_age=None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.entries = collections.OrderedDict() # key -> (time stored, value)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if self.max_age is not None and time.monotonic() - entry[0] > self.max_age:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+def fetch_cached_md_contents(executor, service, pages):
+    # Fetch the documentation pages of the operations of a service, taking those fetched recently from "pages"
+    # (an LruCache). Pages that could not be fetched are not remembered, so they are tried again the next time.
+    keys = [(service.name.lower(), operation.api_method.lower()) for operation in service.operations]
+    md_contents = {key: pages.get(key) for key in set(keys)}
+    md_futures = {key: executor.submit(fetch_md_content, *key) for key, md_content in md_contents.items() if md_content is None}
+    for key, md_future in md_futures.items():
+        md_contents[key] = md_future.result()
+        if md_contents[key] is not None:
+            pages.put(key, md_contents[key])
+    return [md_contents[key] for key in keys]
+
+
+class RenderMemo:
+    # Remembers the services render_outputs rendered, by output file, so a later render of the same interfaces
+    # can take them as they are until the service is forgotten (its interface was rebuilt) or the shared types change.
+
+    def __init__(self):
+        self.entries = {} # output file -> (types hash, content, method fingerprints)
+
+    def get(self, service, types_hash):
+        entry = self.entries.get(service.output_file)
+        if entry is None or entry[0] != types_hash:
+            return None
+        return entry[1:]
+
+    def put(self, service, types_hash, content, fingerprints):
+        self.entries[service.output_file] = (types_hash, content, fingerprints)
+
+    def forget(self, output_file):
+        self.entries.pop(output_file, None)
+
+
+class WatchSession:
+    # Keeps the parsed services, their interfaces and rendered outputs and the fetched documentation pages in memory,
+    # so a changed service JSON only costs re-parsing that file and re-rendering its outputs.
+
+    def __init__(self, source_path, target_path, executor, validate=True):
+        self.source_path = source_path
+        self.target_path = target_path
+        self.executor = executor
+        self.validate = validate
+        self.services = {} # proxy -> (service, interface)
+        self.docs = LruCache(PAGE_CACHE_SIZE, max_age=PAGE_MAX_AGE) # (service name, method name), lowercased -> documentation page
+        self.renders = RenderMemo()
+
+    def load(self, proxy):
+        # (Re)load a service, fetching only the documentation pages not already in memory.
+        try:
+            with open(f"{self.source_path}/{proxy}.json", "rb") as output:
+                source = output.read()
+            service = normalize_service(source, content_hash(source))
+        except FileNotFoundError:
+            previous = self.services.pop(proxy, None)
+            if previous is not None:
+                self.renders.forget(previous[0].output_file)
+            return
+        except ValueError as e:
+            print(f"Error parsing {self.source_path}/{proxy}.json: {e}")
+            return
+
+        md_contents = fetch_cached_md_contents(self.executor, service, self.docs)
+        self.services[proxy] = (service, build_service_interface(service, md_contents))
+        self.renders.forget(service.output_file)
+
+    def write(self):
+        # Write the outputs, rendering only the services loaded since the last write, or all of them when the
+        # shared types changed, and return the files whose content changed.
+        sink = DirectorySink(self.target_path)
+        write_outputs(render_outputs([self.services[proxy] for proxy in sorted(self.services)], validate=self.validate,
+                                     renders=self.renders), sink)
+        return sink.written
+
+    def run(self, proxy_name_array):
+        for proxy in proxy_name_array:
+            self.load(proxy)
+        self.write()
+
+        watcher = open_watcher(self.source_path)
+        print(f"Watching {self.source_path} for changes, press Ctrl+C to stop.")
+        while True:
+            changed = wait_for_changes(watcher)
+            started = time.perf_counter()
+            proxies, written = self.update(changed)
+            if proxies:
+                print(f"{', '.join(proxies)} changed, {len(written)} files written in {(time.perf_counter() - started) * 1000:.0f} ms.")
+                # A session never reaches the end of a run, where the cache is trimmed, so it is trimmed after each change.
+                if docs_cache is not None:
+                    docs_cache.evict()
+
+    def update(self, changed):
+        # Reload the changed service JSON files, rewrite their outputs and remove the outputs no service produces any more.
+        proxies = sorted({name[:-5] for name in changed if name.endswith(".json") and name[:-5] not in EXCLUDED_SERVICES})
+        if not proxies:
+            return proxies, []
+
+        previous_files = {self.services[proxy][0].output_file for proxy in proxies if proxy in self.services}
+        for proxy in proxies:
+            self.load(proxy)
+        # A renamed JSON file can still produce the same output, so only the files no loaded service produces go.
+        current_files = {service.output_file for service, interface in self.services.values()}
+
+        written = self.write()
+        for output_file in previous_files - current_files:
+            if os.path.exists(f"{self.target_path}/{output_file}"):
+                os.remove(f"{self.target_path}/{output_file}")
+        return proxies, written
+
+
+class DtsServer(http.server.ThreadingHTTPServer):
+    # Generates the outputs of a service when they are first requested, then answers from memory until its JSON changes.
+    # Services are rendered on their own, with every return type inlined, so each response is complete by itself.
+    daemon_threads = True
+
+    def __init__(self, address, source_path, executor, validate=True, cache_size=SERVE_CACHE_SIZE):
+        super().__init__(address, DtsRequestHandler)
+        self.source_path = source_path
+        self.executor = executor
+        self.validate = validate
+        # proxy -> (mtime, size, source hash, service name, rendered content); re-rendered once its pages may have aged out
+        self.services = LruCache(cache_size, max_age=PAGE_MAX_AGE)
+        self.service_names = {} # proxy -> (mtime, size, service name), for the service proxies file
+        self.service_proxies = None # (service names, rendered content)
+        self.pages = LruCache(PAGE_CACHE_SIZE, max_age=PAGE_MAX_AGE) # (service, method), lowercased -> documentation page
+        self.lock = threading.Lock()
+        self.evicted_at = time.monotonic()
+
+    def service_actions(self):
+        # Called by serve_forever between requests: the server never reaches the end of a run, where the documentation
+        # cache is trimmed, so it is trimmed every CACHE_EVICT_INTERVAL seconds instead.
+        if docs_cache is not None and time.monotonic() - self.evicted_at >= CACHE_EVICT_INTERVAL:
+            self.evicted_at = time.monotonic()
+            docs_cache.evict()
+
+    def proxies(self):
+        # The service JSON files in the source folder, as proxy -> os.stat_result.
+        return {file.name[:-5]: file.stat() for file in os.scandir(self.source_path)
+                if file.name.endswith(".json") and file.name[:-5] not in EXCLUDED_SERVICES}
+
+    def find_proxy(self, name, proxies):
+        # Accept the JSON file name ("GlobalEntity"), the proxy name ("global-entity") or the output file name.
+        name = name.lower()
+        if name.startswith("lib.cloudcode.") and name.endswith("-service-proxy.d.ts"):
+            name = name[len("lib.cloudcode."):-len("-service-proxy.d.ts")]
+        for proxy in proxies:
+            if proxy.lower() == name or service_proxy_name(proxy) == name:
+                return proxy
+        return None
+
+    def service(self, proxy, stat):
+        # The rendered service, regenerated only when both the mtime/size and the content of its JSON changed.
+        cached = self.services.get(proxy)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            stats.count("serve_hits")
+            return cached[4]
+
+        with open(f"{self.source_path}/{proxy}.json", "rb") as json_file:
+            source = json_file.read()
+        source_hash = content_hash(source)
+        if cached is not None and cached[2] == source_hash:
+            stats.count("serve_hits")
+            self.services.put(proxy, (stat.st_mtime_ns, stat.st_size) + cached[2:])
+            return cached[4]
+
+        stats.count("serve_misses")
+        service = normalize_service(source, source_hash)
+        service_name = service.name
+        md_contents = fetch_cached_md_contents(self.executor, service, self.pages)
+        with stats.stage("render"):
+            content = render_service_proxy(service, md_contents)
+        if self.validate:
+            report_diagnostics(service_output_file(service_name), validate_dts(content))
+        self.services.put(proxy, (stat.st_mtime_ns, stat.st_size, source_hash, service_name, content))
+        with self.lock:
+            self.service_names[proxy] = (stat.st_mtime_ns, stat.st_size, service_name)
+        return content
+
+    def service_proxies_content(self, proxies):
+        # The service proxies file only needs the service names, which are re-read from the JSON files that changed.
+        names = []
+        for proxy, stat in sorted(proxies.items()):
+            with self.lock:
+                known = self.service_names.get(proxy)
+            if known is None or known[:2] != (stat.st_mtime_ns, stat.st_size):
+                with open(f"{self.source_path}/{proxy}.json", "rb") as json_file:
+                    known = (stat.st_mtime_ns, stat.st_size, json.loads(json_file.read())["serviceName"])
+                with self.lock:
+                    self.service_names[proxy] = known
+            names.append(known[2])
+
+        with self.lock:
+            if self.service_proxies is not None and self.service_proxies[0] == names:
+                return self.service_proxies[1]
+        content = render_service_proxies(names)
+        with self.lock:
+            self.service_proxies = (names, content)
+        return content
+
+
+class DtsRequestHandler(http.server.BaseHTTPRequestHandler):
+    # Answers "GET /dts/<service>" and "GET /dts/service-proxies" with the current typings.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        started = time.perf_counter()
+        parts = urllib.parse.urlparse(self.path).path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "dts":
+            return self.send_text(404, f"Unknown path {self.path}, expected /dts/<service> or /dts/service-proxies\n")
+
+        proxies = self.server.proxies()
+        try:
+            if parts[1] == "service-proxies":
+                content = self.server.service_proxies_content(proxies)
+            else:
+                proxy = self.server.find_proxy(urllib.parse.unquote(parts[1]), proxies)
+                if proxy is None:
+                    return self.send_text(404, f"Unknown service {parts[1]}\n")
+                content = self.server.service(proxy, proxies[proxy])
+        except (OSError, ValueError, KeyError, CircuitOpenError) as e:
+            print(f"Error generating {self.path}: {e}")
+            return self.send_text(500, f"Error generating {self.path}: {e}\n")
+
+        etag = f'"{content_hash(content)[:16]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self.send_text(200, content, etag)
+        stats.add_stage("serve", time.perf_counter() - started)
+
+    def send_text(self, status, text, etag=None):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def configure_docs(location=GITHUB_BASE_URL, fetch_jobs=FETCH_CONCURRENCY, rate_limit=HTTP_RATE_LIMIT, retries=HTTP_RETRIES,
+                   cache_dir=CACHE_PATH, max_age=None, cache_max_bytes=CACHE_MAX_BYTES, refresh=False):
+    # Choose where fetch_md_content reads the documentation pages from; a cache_dir of None disables the cache.
+    global docs_cache, docs_source, http_client
+    http_client = HttpClient(pool_size=max(1, fetch_jobs), rate_limit=rate_limit, retries=retries)
+    docs_source = open_docs_source(location)
+    docs_cache = None
+    if cache_dir is not None and isinstance(docs_source, HttpDocsSource):
+        docs_cache = DocsCache(cache_dir, max_age=max_age, max_bytes=cache_max_bytes, refresh=refresh)
+
+
+# The library API: a generation is a chain of generator stages, so a caller can stream the outputs anywhere,
+# stop early or generate only some services, and keep one process (with its fetched pages and inferred types) warm:
+#
+#   generator.write_outputs(generator.render_outputs(generator.iter_interfaces(generator.iter_operations(
+#       generator.iter_services(source_path, names=["Friend"])))), generator.MemorySink())
+#
+# generate() chains the stages the same way. The command line chains them too, into a ManifestSink that only
+# rewrites what changed since the previous run, wrapped in a BundleSink and a HashedSink for --bundle and --hashed.
+
+def iter_ahead(items, start, finish, lookahead):
+    # Yield finish(item, start(item)) for each item in order, with the next "lookahead" items (all of them if None)
+    # already started while the caller handles the current one.
+    pending = collections.deque()
+    for item in items:
+        pending.append((item, start(item)))
+        if lookahead is not None and len(pending) > lookahead:
+            yield finish(*pending.popleft())
+    while pending:
+        yield finish(*pending.popleft())
+
+
+def iter_services(source, names=None, models=None, normalized=None):
+    # Yield the ServiceModel of each service JSON file of the source (a folder, or a DirectoryJsonSource or GitJsonSource)
+    # in file name order. "names" limits the services to the given JSON file names or proxy names ("global-entity").
+    # "models" (proxy -> (file stamp, ServiceModel), see load_model_snapshot) lets a file whose stamp did not change
+    # reuse the model of an earlier run; once every service is yielded, it holds the models of this run.
+    # Pass the same "normalized" (source hash -> ServiceModel) to several runs to parse a JSON file they share once.
+    if isinstance(source, str):
+        source = DirectoryJsonSource(source)
+    wanted = {name.lower() for name in names} if names is not None else None
+    loaded = set()
+    for name in sorted(source.names(), key=lambda name: name[:-5]):
+        proxy = name[:-5]
+        if proxy in EXCLUDED_SERVICES:
+            continue
+        if wanted is not None and proxy.lower() not in wanted and service_proxy_name(proxy) not in wanted:
+            continue
+        started = time.perf_counter()
+        try:
+            stamp = source.stamp(name) if models is not None else None
+            if stamp is not None and proxy in models and models[proxy][0] == stamp:
+                service = models[proxy][1]
+                stats.count("models_reused")
+            else:
+                content = source.read(name)
+                source_hash = content_hash(content)
+                service = normalized.get(source_hash) if normalized is not None else None
+                if service is not None:
+                    stats.count("models_shared")
+                else:
+                    service = normalize_service(content, source_hash)
+                    stats.add_stage("load_json", time.perf_counter() - started, len(content))
+                    if normalized is not None:
+                        normalized[source_hash] = service
+        except FileNotFoundError:
+            print(f"File does not exist: {source.path}/{name}")
+            continue
+        if models is not None:
+            models[proxy] = (stamp, service)
+            loaded.add(proxy)
+        yield service
+    if models is not None:
+        for proxy in set(models) - loaded:
+            del models[proxy]
+
+
+def iter_operations(services, executor=None, pages=None, lookahead=PIPELINE_LOOKAHEAD):
+    # Yield each service with the documentation page of each of its operations, as (service, md_contents).
+    # The pages of the next few services (of all of them if lookahead is None) are already being fetched while
+    # the caller handles the current one; pass the same "pages" ((service, method) -> future) to several runs
+    # to fetch each page once.
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY)
+    pages = {} if pages is None else pages
+    try:
+        yield from iter_ahead(services, lambda service: prefetch_md_contents(executor, service, pages),
+                              lambda service, md_futures: (service, [md_future.result() for md_future in md_futures]),
+                              lookahead)
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_interfaces(documented_services, return_types=None, executor=None, builds=None, lookahead=PIPELINE_LOOKAHEAD):
+    # Yield each service with its DtsInterface, the return types inferred from the documentation pages.
+    # Each page is inferred once per call; pass the same "return_types" to several runs to infer it once for all,
+    # and the same "builds" (service JSON and pages hashes -> DtsInterface) to build the services they have in common once.
+    # With an executor (a ProcessPoolExecutor) the next few services are built in its worker processes instead;
+    # a service whose pages are all in "return_types" already is built in this process, as nothing is left to infer.
+    return_types = {} if return_types is None else return_types
+    builds = {} if builds is None else builds
+
+    def build_key(service, md_contents):
+        return service.source_hash, tuple(content_hash(md_content) if md_content else None for md_content in md_contents)
+
+    if executor is None:
+        for service, md_contents in documented_services:
+            key = build_key(service, md_contents)
+            if key in builds:
+                stats.count("services_reused")
+            else:
+                builds[key] = build_service_interface(service, md_contents, return_types)
+            yield service, builds[key]
+        return
+
+    pending = {} # build key -> future of the services being built in the workers
+
+    def start(documented_service):
+        service, md_contents = documented_service
+        key = build_key(service, md_contents)
+        if key in builds or key in pending:
+            stats.count("services_reused")
+            return key, pending.get(key), False
+        if all(page_hash is None or page_hash in return_types for page_hash in key[1]):
+            return key, None, False
+        pending[key] = executor.submit(build_service_job, service, md_contents)
+        return key, pending[key], True
+
+    def finish(documented_service, started):
+        key, build, first = started
+        if key in builds:
+            return documented_service[0], builds[key]
+        if build is None:
+            builds[key] = build_service_interface(*documented_service, return_types)
+            return documented_service[0], builds[key]
+        interface, job_stats = build.result()
+        if first:
+            stats.merge(job_stats)
+            for page_hash, method in zip(key[1], interface.methods):
+                if page_hash is not None:
+                    return_types[page_hash] = method.return_type
+            builds[key] = interface
+            del pending[key]
+        return documented_service[0], interface
+
+    yield from iter_ahead(documented_services, start, finish, lookahead)
+
+
+def render_outputs(interfaces, shared_types=True, validate=False, executor=None, renders=None, previous_index=None,
+                   only_services=False):
+    # Yield the (file name, content) outputs of the services, then the shared files, "dts_file_names",
+    # the completion index, the signature index and, given the signature index of an earlier run, the delta since then.
+    # With shared_types the object types used more than once are hoisted into lib.cloudcode.response-types.d.ts,
+    # exactly like the command line does, which needs every interface before the first file is rendered.
+    # Without, each service is rendered as soon as it arrives, with its return types inlined.
+    # "validate" reports the syntax errors of the rendered declaration files. With an executor (a ProcessPoolExecutor)
+    # the services are rendered and validated in its worker processes. "renders" (a RenderMemo or a ManifestSink)
+    # hands back the services rendered earlier from the same inputs, which are then not rendered again.
+    # "only_services" yields the files of the services alone, with their types inlined: the shared files and indexes
+    # list every service, so a subset of them must not replace the ones of a full run.
+    shared_types = shared_types and not only_services
+    registry = None
+    types_content = types_hash = None
+    if shared_types:
+        interfaces = list(interfaces)
+        registry = build_registry([interface for service, interface in interfaces])
+        types_content = registry.render()
+        types_hash = content_hash(types_content)
+
+    def start(item):
+        service, interface = item
+        if registry is not None:
+            interface = registry.hoist_interface(interface)
+        rendered = renders.get(service, types_hash) if renders is not None else None
+        if rendered is not None or executor is None:
+            return interface, rendered, None
+        return interface, None, executor.submit(render_service_job, interface, validate, True)
+
+    def finish(item, started):
+        service = item[0]
+        interface, rendered, render_job = started
+        if rendered is None:
+            if render_job is not None:
+                content, fingerprints, diagnostics, job_stats = render_job.result()
+                stats.merge(job_stats)
+            else:
+                content, fingerprints, diagnostics, job_stats = render_service_job(interface, validate, False)
+            report_diagnostics(service.output_file, diagnostics)
+            rendered = content, fingerprints
+            if renders is not None:
+                renders.put(service, types_hash, content, fingerprints)
+        return service, interface, rendered
+
+    file_names = []
+    service_names = []
+    completion_entries = []
+    signatures = {}
+    file_hashes = {}
+    # The hoisted interfaces are all in memory already, so every render can be started at once.
+    for service, interface, (content, fingerprints) in iter_ahead(
+            interfaces, start, finish, None if shared_types else PIPELINE_LOOKAHEAD):
+        file_names.append(service.output_file)
+        service_names.append(service.name)
+        completion_entries.append(build_completion_entry(service.name, interface))
+        signatures[service.name] = {"file": service.output_file, "methods": fingerprints}
+        file_hashes[service.output_file] = content_hash(content)
+        yield service.output_file, content
+    if only_services:
+        return
+
+    shared_files = [("lib.cloudcode.response-types.d.ts", types_content)] if shared_types else []
+    shared_files.append(("lib.cloudcode.service-proxies.d.ts", render_service_proxies(service_names)))
+    for file_name, content in shared_files:
+        if validate:
+            report_diagnostics(file_name, validate_dts(content))
+        file_names.append(file_name)
+        file_hashes[file_name] = content_hash(content)
+        yield file_name, content
+
+    yield "dts_file_names", "".join(f'{i}\n' for i in file_names)
+    yield COMPLETION_INDEX_FILE_NAME, render_completion_index(completion_entries, registry)
+
+    # The fingerprint of every method and the hash of every declaration file, to diff a later run against.
+    signature_index = {"version": SIGNATURE_INDEX_VERSION, "services": signatures, "files": file_hashes}
+    yield SIGNATURE_INDEX_FILE_NAME, json.dumps(signature_index, indent=2, sort_keys=True)
+    if previous_index is not None:
+        yield DELTA_FILE_NAME, json.dumps(diff_signature_indexes(previous_index, signature_index), indent=2, sort_keys=True)
+
+
+# A sink takes the outputs with write(name, content), then close(). close(False) means the outputs stopped short
+# (the generation failed), in which case a sink only releases what it holds.
+
+class MemorySink:
+    # Keeps the outputs in "files", file name -> content.
+
+    def __init__(self):
+        self.files = {}
+
+    def write(self, name, content):
+        self.files[name] = content
+
+    def close(self, complete=True):
+        pass
+
+
+class DirectorySink:
+    # Writes the outputs into a folder, leaving the files whose content did not change untouched.
+
+    def __init__(self, path):
+        self.path = path
+        self.written = []
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, name, content):
+        if write_if_changed(f"{self.path}/{name}", content):
+            self.written.append(name)
+
+    def close(self, complete=True):
+        pass
+
+
+class ManifestSink(DirectorySink):
+    # Writes the outputs into a folder like DirectorySink, and records them in its manifest (.dts_manifest.json):
+    # the hash of every file, and what each service was rendered from. Given to render_outputs as "renders",
+    # a service whose JSON, pages and shared types did not change since the previous run is taken from the file
+    # it wrote then; and once complete, the files of the previous run that are no longer outputs are removed.
+    # The inputs of each service are recorded by passing the (service, md_contents) of iter_operations through track.
+
+    def __init__(self, path, settings, force=False):
+        super().__init__(path)
+        # The manifest of the previous run is only usable when it was produced with the same settings.
+        self.previous = None if force else load_manifest(path)
+        if self.previous is not None and self.previous["settings"] != settings:
+            self.previous = None
+        self.manifest = {"version": MANIFEST_VERSION, "settings": settings, "services": {}, "files": {}}
+        self.reused = 0
+
+    def track(self, documented_services):
+        for service, md_contents in documented_services:
+            docs_hashes = {f"{service.name.lower()}/{operation.api_method.lower()}": content_hash(md_content) if md_content else None
+                           for operation, md_content in zip(service.operations, md_contents)}
+            self.manifest["services"][service.output_file] = {"source": service.source_hash, "docs": docs_hashes}
+            yield service, md_contents
+
+    def get(self, service, types_hash):
+        # The previous output of a service rendered from the same inputs, as (content, method fingerprints),
+        # if it is still the file that run wrote.
+        entry = self.manifest["services"].get(service.output_file)
+        previous = self.previous["services"].get(service.output_file) if self.previous is not None else None
+        if (entry is None or previous is None or previous["source"] != entry["source"] or previous["docs"] != entry["docs"]
+                or previous.get("types") != types_hash):
+            return None
+        try:
+            with open(f"{self.path}/{service.output_file}", "r") as existing:
+                content = existing.read()
+        except OSError:
+            return None
+        if content_hash(content) != self.previous["files"].get(service.output_file):
+            return None
+        self.put(service, types_hash, content, previous["methods"])
+        self.reused += 1
+        return content, previous["methods"]
+
+    def put(self, service, types_hash, content, fingerprints):
+        entry = self.manifest["services"].setdefault(service.output_file, {"source": service.source_hash, "docs": None})
+        entry["types"] = types_hash
+        entry["methods"] = fingerprints
+
+    def keep(self, name):
+        # Keep a file of the previous run as an output without writing it again, if it is still there.
+        file_hash = self.previous["files"].get(name) if self.previous is not None else None
+        if file_hash is None or not os.path.exists(f"{self.path}/{name}"):
+            return False
+        self.manifest["files"][name] = file_hash
+        return True
+
+    def write(self, name, content):
+        super().write(name, content)
+        self.manifest["files"][name] = content_hash(content)
+
+    def close(self, complete=True):
+        # An incomplete run leaves the previous manifest, which no longer matches the files rewritten since.
+        if not complete:
+            return
+        if self.previous is not None:
+            for stale_file in self.previous["files"]:
+                if stale_file not in self.manifest["files"] and os.path.exists(f"{self.path}/{stale_file}"):
+                    os.remove(f"{self.path}/{stale_file}")
+        write_if_changed(f"{self.path}/{MANIFEST_FILE_NAME}", json.dumps(self.manifest, indent=2, sort_keys=True))
+
+
+class BundleSink:
+    # Passes the outputs on to another sink, then adds the bundle of every file listed in "dts_file_names"
+    # (see render_bundle), a gzip variant of it and its index.
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.files = {}
+
+    def write(self, name, content):
+        if isinstance(content, str):
+            self.files[name] = content
+        self.sink.write(name, content)
+
+    def close(self, complete=True):
+        try:
+            if complete:
+                bundle, index = render_bundle(self.files["dts_file_names"].splitlines(), self.files)
+                bundle_index = json.dumps({"version": BUNDLE_VERSION, "bundle": BUNDLE_FILE_NAME, "files": index},
+                                          separators=(",", ":"))
+                self.sink.write(BUNDLE_FILE_NAME, bundle)
+                self.sink.write(f"{BUNDLE_FILE_NAME}.gz", gzip.compress(bundle, mtime=0))
+                self.sink.write(BUNDLE_INDEX_FILE_NAME, bundle_index)
+        finally:
+            self.sink.close(complete)
+
+
+class HashedSink:
+    # Passes the outputs on to another sink, then adds a content-addressed copy of every file listed in "dts_file_names"
+    # and of the completion index, with its precompressed variants (see render_asset), and the assets manifest mapping
+    # each output to them. Given the assets of the previous run (see load_assets) and a sink that can keep the files
+    # of that run (a ManifestSink), a copy whose name (so content) is unchanged is kept, without compressing it again.
+
+    def __init__(self, sink, previous=None):
+        self.sink = sink
+        self.previous = previous or {}
+        self.files = {}
+
+    def write(self, name, content):
+        if isinstance(content, str):
+            self.files[name] = content
+        self.sink.write(name, content)
+
+    def close(self, complete=True):
+        try:
+            if complete:
+                encodings = {encoding for encoding, extension, compress in ASSET_ENCODINGS}
+                assets = {}
+                for name in self.files["dts_file_names"].splitlines() + [COMPLETION_INDEX_FILE_NAME]:
+                    data = self.files[name].encode('utf-8')
+                    previous = self.previous.get(name)
+                    if (previous is not None and previous["file"] == hashed_file_name(name, data)
+                            and set(previous["encodings"]) == encodings
+                            and all(self.sink.keep(file) for file in asset_files(previous))):
+                        assets[name] = previous
+                        continue
+                    files, assets[name] = render_asset(name, data)
+                    for file, content in files:
+                        self.sink.write(file, content)
+                self.sink.write(ASSETS_FILE_NAME, json.dumps({"version": ASSETS_VERSION, "files": assets}, indent=2, sort_keys=True))
+        finally:
+            self.sink.close(complete)
+
+
+class TarSink:
+    # Writes the outputs into a tar archive (gzip compressed unless told otherwise), given as a path or a binary file.
+    # Members get a zero mtime, and so does the gzip stream, so the same outputs always make the same archive.
+
+    def __init__(self, target, compression="gz"):
+        self.file = open(target, "wb") if isinstance(target, str) else None
+        fileobj = target if self.file is None else self.file
+        # tarfile would stamp the gzip header with the current time, so the gzip stream is opened here.
+        self.gzip = None
+        if compression == "gz":
+            self.gzip = gzip.GzipFile(filename="", mode="wb", fileobj=fileobj, mtime=0)
+            fileobj, compression = self.gzip, None
+        self.tar = tarfile.open(fileobj=fileobj, mode=f"w:{compression}" if compression else "w")
+
+    def write(self, name, content):
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mode = 0o644
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self, complete=True):
+        self.tar.close()
+        if self.gzip is not None:
+            self.gzip.close()
+        if self.file is not None:
+            self.file.close()
+
+
+def write_outputs(outputs, sink):
+    # Drain the (file name, content) outputs into the sink, then close it.
+    try:
+        for name, content in outputs:
+            sink.write(name, content)
+    except BaseException:
+        sink.close(False)
+        raise
+    sink.close()
+    return sink
+
+
+def generate(source, sink, names=None, shared_types=True, executor=None, pages=None, return_types=None):
+    # Generate the outputs of the services of a source (see iter_services) into a sink, and return the sink.
+    # Given "names", only the files of those services are generated, with their types inlined, so generating a few
+    # services into the folder of a full run leaves its shared files and indexes as they are.
+    return write_outputs(render_outputs(iter_interfaces(iter_operations(iter_services(source, names), executor, pages),
+                                                        return_types), shared_types, only_services=names is not None), sink)
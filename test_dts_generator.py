@@ -0,0 +1,697 @@
+import base64
+import gzip
+import hashlib
+import http.server
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import dts_generator as generator
+
+
+def interface_returning(*return_types):
+    methods = [generator.DtsMethod(f"method{index}", "desc", [], return_type) for index, return_type in enumerate(return_types)]
+    return generator.DtsInterface("TestServiceProxy", methods, False)
+
+
+def test_hoisted_type_with_punctuation_key_gets_a_name():
+    inferred = generator.infer_json_type({'data': {'$$': {'a': 1}, 'z': 1}, 'other': {'$$': {'a': 1}}})
+    registry = generator.build_registry([interface_returning(inferred)])
+    names = [name for name, hoisted in registry.named_types()]
+    assert len(names) == 1
+    assert names[0].startswith("Type_")
+    assert f"interface {names[0]} {{" in registry.render()
+    assert generator.validate_dts(registry.render()) == []
+
+    content = generator.render_service_interface(registry.hoist_interface(interface_returning(inferred)))
+    assert f'"$$": {names[0]};' in content
+    assert generator.validate_dts(content) == []
+
+
+def write_service_json(path, service_name, method_names):
+    operations = [{"apiMethod": name, "desc": f"Does {name}", "paramInfo": []} for name in method_names]
+    with open(path, "w") as json_file:
+        json.dump({"serviceName": service_name, "operations": operations}, json_file)
+
+
+def test_watch_keeps_the_output_of_a_renamed_service_json(tmp_path):
+    source, target, docs = tmp_path / "json", tmp_path / "out", tmp_path / "docs"
+    for folder in (source, target, docs):
+        folder.mkdir()
+    generator.configure_docs(str(docs))
+    write_service_json(source / "Group.json", "Group", ["ReadGroup"])
+    session = generator.WatchSession(str(source), str(target), ThreadPoolExecutor(max_workers=1))
+    session.load("Group")
+    session.write()
+
+    os.rename(source / "Group.json", source / "Group2.json")
+    session.update({"Group.json", "Group2.json"})
+
+    assert (target / "lib.cloudcode.group-service-proxy.d.ts").exists()
+    assert "lib.cloudcode.group-service-proxy.d.ts" in (target / "dts_file_names").read_text()
+
+    os.remove(source / "Group2.json")
+    session.update({"Group2.json"})
+    assert not (target / "lib.cloudcode.group-service-proxy.d.ts").exists()
+
+
+def test_tarball_docs_source_reads_pages_from_a_compressed_archive(tmp_path):
+    archive = tmp_path / "docs.tar.gz"
+    with tarfile.open(archive, "w:gz") as tar:
+        for name, text in (("braincloud-docs/docs/api/2_capi/friend/readfriend.md", "api page"),
+                           ("braincloud-docs/other/friend/readfriend.md", "other page"),
+                           ("braincloud-docs/docs/api/2_capi/group/readgroup.md", "group page")):
+            data = text.encode('utf-8')
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+    source = generator.TarballDocsSource(str(archive))
+    assert source.fetch("Friend", "ReadFriend") == "api page"
+    assert source.fetch("group", "readgroup") == "group page"
+    assert source.fetch("group", "missing") is None
+
+
+def fake_http(responses):
+    # An http_get answering with the given (status, headers, body) tuples in turn; non-2xx statuses are raised.
+    requests = []
+
+    def http_get(url, headers):
+        requests.append(dict(headers))
+        status, response_headers, body = responses.pop(0)
+        if status >= 300:
+            raise urllib.error.HTTPError(url, status, "error", response_headers, None)
+        return status, response_headers, body
+
+    return http_get, requests
+
+
+def test_docs_cache_falls_back_to_the_stale_copy_on_server_errors(tmp_path, monkeypatch):
+    http_get, requests = fake_http([(200, {"ETag": '"v1"'}, b"page"), (503, {}, b""), (429, {}, b"")])
+    monkeypatch.setattr(generator, "http_get", http_get)
+    cache = generator.DocsCache(str(tmp_path))
+    url = "http://docs/friend/readfriend.md"
+
+    assert cache.fetch(url) == "page"
+    assert cache.fetch(url) == "page"
+    assert cache.fetch(url) == "page"
+    assert requests[1]["If-None-Match"] == '"v1"'
+
+
+def test_docs_cache_only_stops_on_an_open_circuit_without_a_cached_copy(tmp_path, monkeypatch):
+    http_get, requests = fake_http([(200, {}, b"page")])
+    monkeypatch.setattr(generator, "http_get", http_get)
+    cache = generator.DocsCache(str(tmp_path))
+    assert cache.fetch("http://docs/friend/readfriend.md") == "page"
+
+    def failing_http_get(url, headers):
+        raise generator.CircuitOpenError("docs is failing")
+
+    monkeypatch.setattr(generator, "http_get", failing_http_get)
+    assert cache.fetch("http://docs/friend/readfriend.md") == "page"
+    with pytest.raises(generator.CircuitOpenError):
+        cache.fetch("http://docs/group/readgroup.md")
+
+
+def test_page_that_failed_to_fetch_is_fetched_again(monkeypatch):
+    answers = {"readfriend": [None, "page"]}
+    monkeypatch.setattr(generator, "fetch_md_content", lambda service_name, method_name: answers[method_name].pop(0))
+    service = generator.normalize_service(json.dumps(
+        {"serviceName": "Friend", "operations": [{"apiMethod": "ReadFriend", "desc": "Reads", "paramInfo": []}]}), "hash")
+    pages = generator.LruCache(2)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert generator.fetch_cached_md_contents(executor, service, pages) == [None]
+        assert generator.fetch_cached_md_contents(executor, service, pages) == ["page"]
+        assert generator.fetch_cached_md_contents(executor, service, pages) == ["page"]
+
+
+def test_lru_cache_forgets_old_entries(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(generator.time, "monotonic", lambda: now[0])
+    cache = generator.LruCache(2, max_age=10)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    now[0] += 11
+    assert cache.get("a") is None
+
+
+def test_run_stats_keep_only_the_slowest_requests(monkeypatch):
+    monkeypatch.setattr(generator, "PROFILE_SLOWEST_URLS", 3)
+    run_stats = generator.RunStats()
+    for index in range(100):
+        run_stats.add_request(f"http://docs/{index}.md", (index * 37) % 100, 200)
+    assert len(run_stats.requests) == 3
+    assert [entry["seconds"] for entry in run_stats.report()["slowest_urls"]] == [99, 98, 97]
+    assert run_stats.report()["http_status"] == {"200": 100}
+
+
+def test_server_trims_the_docs_cache_while_it_runs(monkeypatch):
+    evictions = []
+    monkeypatch.setattr(generator, "docs_cache", type("Cache", (), {"evict": lambda self: evictions.append(1)})())
+    monkeypatch.setattr(generator, "CACHE_EVICT_INTERVAL", 0)
+    server = generator.DtsServer(("127.0.0.1", 0), ".", None)
+    try:
+        server.service_actions()
+        server.service_actions()
+    finally:
+        server.server_close()
+    assert len(evictions) == 2
+
+
+def test_inferred_return_types_are_kept_only_by_the_caller():
+    service = generator.normalize_service(json.dumps({"serviceName": "Friend", "operations": [
+        {"apiMethod": "ReadFriend", "desc": "Reads", "paramInfo": []},
+        {"apiMethod": "ReadFriends", "desc": "Reads", "paramInfo": []}]}), "hash")
+    page = '```\n{"data": {"name": "x"}, "status": 200}\n```\n'
+    return_types = {}
+
+    interface = generator.build_service_interface(service, [page, page], return_types)
+    assert list(return_types) == [generator.content_hash(page)]
+    assert interface.methods[0].return_type is interface.methods[1].return_type
+
+
+def test_parameter_without_a_type_is_skipped_with_a_warning(capsys):
+    service = generator.normalize_service(json.dumps({"serviceName": "Foo", "operations": [
+        {"apiMethod": "Bar", "desc": "Bars", "paramInfo": [{"name": "baz", "desc": "No type"},
+                                                         {"name": "qux", "type": "string", "desc": "Typed"}]}]}), "hash")
+    assert 'Parameter <baz> of bar missing "paramInfo.type"' in capsys.readouterr().out
+    content = generator.render_service_interface(generator.build_service_interface(service, [None]))
+    assert "\tbar(qux: string): ServiceProxyResponse;" in content
+    assert generator.validate_dts(content) == []
+
+
+def generate_into_manifest(source, target, previous_index=None):
+    manifest = generator.ManifestSink(str(target), "settings")
+    documented_services = manifest.track(generator.iter_operations(generator.iter_services(str(source))))
+    generator.write_outputs(generator.render_outputs(generator.iter_interfaces(documented_services), renders=manifest,
+                                                     previous_index=previous_index), manifest)
+    return manifest
+
+
+def test_manifest_sink_rerenders_only_what_changed(tmp_path):
+    source, target, docs = tmp_path / "json", tmp_path / "out", tmp_path / "docs"
+    for folder in (source, docs):
+        folder.mkdir()
+    generator.configure_docs(str(docs))
+    write_service_json(source / "Friend.json", "Friend", ["ReadFriend"])
+    write_service_json(source / "Group.json", "Group", ["ReadGroup"])
+
+    first = generate_into_manifest(source, target)
+    assert first.reused == 0
+    assert {generator.COMPLETION_INDEX_FILE_NAME, generator.SIGNATURE_INDEX_FILE_NAME} <= set(first.written)
+
+    write_service_json(source / "Friend.json", "Friend", ["ReadFriend", "AddFriends"])
+    os.remove(source / "Group.json")
+    previous_index = json.loads((target / generator.SIGNATURE_INDEX_FILE_NAME).read_text())
+    second = generate_into_manifest(source, target, previous_index)
+    assert second.reused == 0
+    assert not (target / "lib.cloudcode.group-service-proxy.d.ts").exists()
+    delta = json.loads((target / generator.DELTA_FILE_NAME).read_text())
+    assert delta["interfaces"]["FriendServiceProxy"]["added"] == ["addFriends"]
+    assert delta["removed_files"] == ["lib.cloudcode.group-service-proxy.d.ts"]
+
+    third = generate_into_manifest(source, target)
+    assert third.reused == 1
+    assert third.written == []
+    assert not (target / generator.DELTA_FILE_NAME).exists()
+
+
+GENERATOR_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "updated-version-generator.py")
+
+
+def test_generating_some_services_leaves_the_shared_files_of_the_folder(tmp_path):
+    source, target, docs = tmp_path / "json", tmp_path / "out", tmp_path / "docs"
+    for folder in (source, target, docs):
+        folder.mkdir()
+    generator.configure_docs(str(docs))
+    write_service_json(source / "Friend.json", "Friend", ["ReadFriend"])
+    write_service_json(source / "Group.json", "Group", ["ReadGroup"])
+    generator.generate(str(source), generator.DirectorySink(str(target)))
+    shared_files = {name: (target / name).read_text() for name in os.listdir(target) if "-service-proxy." not in name}
+
+    assert list(generator.generate(str(source), generator.MemorySink(), names=["Friend"]).files) == [
+        "lib.cloudcode.friend-service-proxy.d.ts"]
+    generator.generate(str(source), generator.DirectorySink(str(target)), names=["Friend"])
+    assert {name: (target / name).read_text() for name in shared_files} == shared_files
+    assert "lib.cloudcode.group-service-proxy.d.ts" in (target / "dts_file_names").read_text()
+
+
+def test_type_inference_makes_fields_missing_from_some_elements_optional():
+    inferred = generator.infer_json_type([{"a": 1, "b": "x"}, {"a": 2, "c": None}])
+    assert inferred == ("array", ("object", (("a", generator.NUMBER_TYPE, False), ("b", generator.STRING_TYPE, True),
+                                             ("c", generator.NULL_TYPE, True))))
+
+
+def test_type_inference_unions_keep_one_object_and_one_array_member():
+    inferred = generator.infer_json_type([{"a": 1}, 1, {"b": "x"}, [1], ["x"], None])
+    assert inferred == ("array", ("union", (
+        ("object", (("a", generator.NUMBER_TYPE, True), ("b", generator.STRING_TYPE, True))),
+        generator.NUMBER_TYPE,
+        ("array", ("union", (generator.NUMBER_TYPE, generator.STRING_TYPE))),
+        generator.NULL_TYPE)))
+
+
+def test_type_inference_stays_within_its_budget():
+    assert generator.infer_json_type([]) == ("array", generator.EMPTY_TYPE)
+    assert generator.TypeInference(max_depth=1).infer({"a": {"b": 1}}) == ("object", (("a", generator.RECORD_TYPE, False),))
+    assert generator.TypeInference(max_nodes=2).infer({"a": 1, "b": 2}) == \
+        ("object", (("a", generator.NUMBER_TYPE, False), ("b", generator.ANY_TYPE, False)))
+    inference = generator.TypeInference(sample_size=2)
+    assert inference.infer([1, 1, "x", "x"]) == ("array", ("union", (generator.NUMBER_TYPE, generator.STRING_TYPE)))
+    assert inference.infer([1, 1, 1, "x"]) == ("array", generator.NUMBER_TYPE)
+
+
+def test_md_scanner_collects_responses_examples_and_tables():
+    document = generator.scan_md_document("\n".join([
+        "## Usage",
+        "<Tabs>",
+        '<TabItem value="cs" label="C#">',
+        "",
+        "```csharp",
+        "var x = 1;",
+        "```",
+        "</TabItem>",
+        "</Tabs>",
+        "",
+        "<details>",
+        "<summary>JSON Response</summary>",
+        "",
+        "```json",
+        '{"data": {"x": 1}}',
+        "```",
+        "</details>",
+        "",
+        "| Parameter | Description |",
+        "|-----------|-------------|",
+        "| a | first |",
+        "| b | second |"]))
+    assert document.responses == ['{"data": {"x": 1}}']
+    assert document.examples == [("Usage", "C#", "var x = 1;")]
+    assert document.tables == [("Usage", ["Parameter", "Description"], [["a", "first"], ["b", "second"]])]
+
+
+def test_md_scanner_only_takes_the_json_block_right_after_the_summary():
+    wrapped = "\n".join(["```mdx-code-block", "<details>", "<summary>JSON Response</summary>", "```", "",
+                         "```json", '{"status": 200}', "```"])
+    assert generator.scan_md_document(wrapped).responses == ['{"status": 200}']
+
+    separated = "\n".join(["<details>", "<summary>JSON Response</summary>", "Some text", "```json", "{}", "```"])
+    document = generator.scan_md_document(separated)
+    assert document.responses == []
+    assert document.examples == [("", "json", "{}")]
+
+    assert generator.extract_json_response("\n".join(["<summary>JSON Response</summary>", "```json", "{", "```"])) is None
+
+
+def test_dts_validator_accepts_the_generated_grammar():
+    content = ('/// <reference no-default-lib="true"/>\n\n'
+               'interface A {\n'
+               '\t/** doc */\n'
+               '\tm(a: string, b?: Array<number>): { x: string | null; "y-z"?: B[]; 0: (A | B)[]; };\n'
+               '\tp: "ASC" | "DESC";\n'
+               '}\n'
+               'interface B {}')
+    assert generator.validate_dts(content) == []
+
+
+def test_dts_validator_reports_syntax_errors_and_suspicious_members():
+    assert generator.validate_dts("interface A {\n\tx: string\n}") == ["3:1: expected ';', found '}'"]
+    assert generator.validate_dts("interface A { x: string; x: number; }") == ["1:26: duplicate member 'x'"]
+    assert generator.validate_dts("interface A { m(delete: string): void; }") == \
+        ["1:17: reserved word 'delete' used as a parameter name"]
+    assert generator.validate_dts("interface A { /* x: string; }") == ["1:15: unterminated comment"]
+    assert generator.validate_dts("type A = string;") == ["1:1: expected 'interface', found 'type'"]
+
+
+class ScriptedHandler(http.server.BaseHTTPRequestHandler):
+    # Answers with the next status of the server's script, 200 once it runs out.
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests += 1
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = f"status {status}".encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def scripted_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ScriptedHandler)
+    server.daemon_threads = True
+    server.statuses = []
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}/page.md"
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_client_retries_server_errors_but_not_missing_pages(scripted_server, monkeypatch):
+    server, url = scripted_server
+    monkeypatch.setattr(generator, "HTTP_BACKOFF", 0)
+    client = generator.HttpClient(pool_size=2, rate_limit=0, retries=2)
+
+    server.statuses = [503, 429]
+    status, headers, body = client.get(url, {})
+    assert (status, body, server.requests) == (200, b"status 200", 3)
+
+    server.statuses = [404]
+    with pytest.raises(urllib.error.HTTPError) as error:
+        client.get(url, {})
+    assert (error.value.code, server.requests) == (404, 4)
+
+
+def test_http_client_fails_fast_once_the_circuit_opens(scripted_server, monkeypatch):
+    server, url = scripted_server
+    monkeypatch.setattr(generator, "HTTP_BACKOFF", 0)
+    monkeypatch.setattr(generator, "HTTP_CIRCUIT_BREAKER_THRESHOLD", 2)
+    client = generator.HttpClient(pool_size=2, rate_limit=0, retries=0)
+
+    server.statuses = [500, 500]
+    for attempt in range(2):
+        with pytest.raises(urllib.error.HTTPError):
+            client.get(url, {})
+    with pytest.raises(generator.CircuitOpenError):
+        client.get(url, {})
+    assert server.requests == 2
+
+
+def test_http_client_waits_out_a_burst_of_429s(scripted_server, monkeypatch):
+    server, url = scripted_server
+    monkeypatch.setattr(generator, "HTTP_BACKOFF", 0.01)
+    client = generator.HttpClient(pool_size=16, rate_limit=0, retries=16)
+
+    server.statuses = [429] * 16
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda index: client.get(url, {}), range(40)))
+    assert {status for status, headers, body in results} == {200}
+    assert server.requests == 56
+
+
+def test_docs_cache_revalidates_and_remembers_missing_pages(tmp_path, monkeypatch):
+    http_get, requests = fake_http([(200, {"ETag": '"v1"'}, b"page"), (304, {}, b""), (404, {}, b"")])
+    monkeypatch.setattr(generator, "http_get", http_get)
+    cache = generator.DocsCache(str(tmp_path))
+
+    assert cache.fetch("http://docs/friend/readfriend.md") == "page"
+    assert cache.fetch("http://docs/friend/readfriend.md") == "page"
+    assert requests[1]["If-None-Match"] == '"v1"'
+    assert cache.fetch("http://docs/friend/missing.md") is None
+    assert cache.fetch("http://docs/friend/missing.md") is None
+    assert len(requests) == 3
+
+    fresh = generator.DocsCache(str(tmp_path), max_age=60)
+    assert fresh.fetch("http://docs/friend/readfriend.md") == "page"
+    assert len(requests) == 3
+
+
+def test_docs_cache_evicts_the_least_recently_used_pages(tmp_path, monkeypatch):
+    http_get, requests = fake_http([(200, {}, b"a" * 100), (200, {}, b"b" * 100), (200, {}, b"c" * 100)])
+    monkeypatch.setattr(generator, "http_get", http_get)
+    cache = generator.DocsCache(str(tmp_path))
+    urls = ["http://docs/a.md", "http://docs/b.md", "http://docs/c.md"]
+    for last_used, url in zip((3000, 1000, 2000), urls):
+        cache.fetch(url)
+        os.utime(f"{cache._entry_path(url)}.json", (last_used, last_used))
+
+    cache.max_bytes = sum(entry.stat().st_size for entry in os.scandir(tmp_path)) - 1
+    cache.evict()
+    assert [os.path.exists(f"{cache._entry_path(url)}.body") for url in urls] == [True, False, True]
+
+
+def run_generator(*arguments, timeout=None):
+    return subprocess.run([sys.executable, GENERATOR_SCRIPT, "--no-cache", *arguments], capture_output=True, text=True,
+                          timeout=timeout)
+
+
+def test_previous_index_in_the_target_folder_is_read_before_it_is_rewritten(tmp_path):
+    source, target, docs = tmp_path / "json", tmp_path / "out", tmp_path / "docs"
+    for folder in (source, docs):
+        folder.mkdir()
+    write_service_json(source / "Friend.json", "Friend", ["ReadFriend"])
+    arguments = ["--source", str(source), "--target", str(target), "--docs", str(docs)]
+    assert run_generator(*arguments).returncode == 0
+
+    write_service_json(source / "Friend.json", "Friend", ["ReadFriend", "AddFriends"])
+    result = run_generator(*arguments, "--previous-index", str(target / generator.SIGNATURE_INDEX_FILE_NAME))
+    assert result.returncode == 0, result.stdout + result.stderr
+    delta = json.loads((target / generator.DELTA_FILE_NAME).read_text())
+    assert delta["interfaces"] == {"FriendServiceProxy": {"added": ["addFriends"], "removed": [], "changed": []}}
+    assert "lib.cloudcode.friend-service-proxy.d.ts" in delta["files"]
+
+
+def test_unchanged_pages_are_not_inferred_again_on_the_next_run(tmp_path):
+    source, target, docs = tmp_path / "json", tmp_path / "out", tmp_path / "docs"
+    for folder in (source, docs / "friend"):
+        folder.mkdir(parents=True)
+    write_service_json(source / "Friend.json", "Friend", ["ReadFriend"])
+    (docs / "friend" / "readfriend.md").write_text("\n".join(["<details>", "<summary>JSON Response</summary>", "",
+                                                              "```json", '{"data": {"name": "x"}, "status": 200}', "```"]))
+    arguments = ["--source", str(source), "--target", str(target), "--docs", str(docs), "--profile", str(tmp_path / "profile.json")]
+    assert run_generator(*arguments).returncode == 0
+    assert "extract_json_response" in json.loads((tmp_path / "profile.json").read_text())["stages"]
+
+    result = run_generator(*arguments, "--jobs", "2", timeout=60)
+    assert result.returncode == 0, result.stdout + result.stderr
+    profile = json.loads((tmp_path / "profile.json").read_text())
+    assert "extract_json_response" not in profile["stages"]
+    assert profile["counters"]["return_types_reused"] == 1
+    assert "name: string;" in (target / "lib.cloudcode.friend-service-proxy.d.ts").read_text()
+
+
+def test_batch_parses_and_builds_the_services_its_versions_share_once(tmp_path):
+    old, new, target, docs = tmp_path / "old", tmp_path / "new", tmp_path / "out", tmp_path / "docs"
+    for folder in (old, new, docs):
+        folder.mkdir()
+    for source in (old, new):
+        write_service_json(source / "Friend.json", "Friend", ["ReadFriend"])
+    write_service_json(old / "Group.json", "Group", ["ReadGroup"])
+    profile_path = tmp_path / "profile.json"
+    result = run_generator("--source", str(new), "--target", str(target), "--docs", str(docs),
+                           "--batch", f"old={old}", f"new={new}", "--profile", str(profile_path))
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "old: Rendered 2 of 2 services" in result.stdout
+    assert "new: Rendered 1 of 1 services" in result.stdout
+    assert not (target / "new" / "lib.cloudcode.group-service-proxy.d.ts").exists()
+    assert ((target / "old" / "lib.cloudcode.friend-service-proxy.d.ts").read_text() ==
+            (target / "new" / "lib.cloudcode.friend-service-proxy.d.ts").read_text())
+
+    profile = json.loads(profile_path.read_text())
+    assert profile["stages"]["load_json"]["calls"] == 2
+    assert profile["counters"]["models_shared"] == 1
+    assert profile["counters"]["services_reused"] == 1
+
+
+def test_generator_stops_without_writing_when_the_docs_host_is_down(tmp_path):
+    source, target = tmp_path / "json", tmp_path / "out"
+    source.mkdir()
+    write_service_json(source / "Friend.json", "Friend", [f"ReadFriend{index}" for index in range(8)])
+    result = run_generator("--source", str(source), "--target", str(target), "--docs", "http://127.0.0.1:1/",
+                           "--retries", "0")
+    assert result.returncode == 1
+    assert "Stopping before writing the outputs" in result.stdout
+    assert not any(name.endswith(".d.ts") for name in os.listdir(target))
+
+
+def git(path, *arguments):
+    subprocess.run(["git", "-C", str(path), "-c", "user.name=test", "-c", "user.email=test@example.com", *arguments],
+                   check=True, capture_output=True)
+
+
+def test_git_revision_renders_in_a_process_pool_and_exits(tmp_path):
+    repository, target, docs = tmp_path / "repo", tmp_path / "out", tmp_path / "docs"
+    source = repository / "json"
+    for folder in (source, docs):
+        folder.mkdir(parents=True)
+    git(repository, "init", "-q")
+    write_service_json(source / "Friend.json", "Friend", ["ReadFriend"])
+    write_service_json(source / "Group.json", "Group", ["ReadGroup"])
+    git(repository, "add", ".")
+    git(repository, "commit", "-q", "-m", "v1")
+    git(repository, "tag", "v1")
+    os.remove(source / "Group.json")
+
+    result = run_generator("--source", str(source), "--target", str(target), "--docs", str(docs),
+                           "--git-rev", "v1", "--jobs", "2", timeout=60)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert (target / "lib.cloudcode.group-service-proxy.d.ts").exists()
+
+    result = run_generator("--source", str(source), "--target", str(tmp_path / "batch"), "--docs", str(docs),
+                           "--batch", "old=v1", f"new={source}", "--jobs", "2", timeout=60)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "old: Rendered 2 of 2 services" in result.stdout
+    assert "new: Rendered 1 of 1 services" in result.stdout
+
+
+def test_unknown_git_revision_is_reported_without_a_traceback(tmp_path):
+    repository, docs = tmp_path / "repo", tmp_path / "docs"
+    source = repository / "json"
+    for folder in (source, docs):
+        folder.mkdir(parents=True)
+    git(repository, "init", "-q")
+    write_service_json(source / "Friend.json", "Friend", ["ReadFriend"])
+    git(repository, "add", ".")
+    git(repository, "commit", "-q", "-m", "v1")
+
+    result = run_generator("--source", str(source), "--target", str(tmp_path / "out"), "--docs", str(docs),
+                           "--git-rev", "missing", timeout=60)
+    assert result.returncode == 1
+    assert f"Cannot read {source} at revision missing" in result.stdout
+    assert "Traceback" not in result.stderr
+
+
+def write_sample_services(tmp_path):
+    # Two services whose documented responses share an object type, which is hoisted into the response types.
+    source, docs = tmp_path / "json", tmp_path / "docs"
+    for folder in (source, docs / "friend", docs / "group"):
+        folder.mkdir(parents=True)
+    write_service_json(source / "Friend.json", "Friend", ["ReadFriend"])
+    write_service_json(source / "Group.json", "Group", ["ReadGroup"])
+    for service, method in (("friend", "readfriend"), ("group", "readgroup")):
+        response = json.dumps({"data": {"owner": {"id": "x"}, service: True}, "status": 200})
+        (docs / service / f"{method}.md").write_text("\n".join(["<details>", "<summary>JSON Response</summary>", "",
+                                                                "```json", response, "```"]))
+    return source, docs
+
+
+def test_process_pool_renders_the_same_outputs_as_a_single_process(tmp_path):
+    source, docs = write_sample_services(tmp_path)
+    outputs = {}
+    for jobs in ("1", "2"):
+        target = tmp_path / f"out{jobs}"
+        result = run_generator("--source", str(source), "--target", str(target), "--docs", str(docs), "--jobs", jobs,
+                               timeout=60)
+        assert result.returncode == 0, result.stdout + result.stderr
+        outputs[jobs] = {name: (target / name).read_text() for name in os.listdir(target) if not name.startswith(".")}
+    assert outputs["2"] == outputs["1"]
+    assert "interface Owner_" in outputs["2"]["lib.cloudcode.response-types.d.ts"]
+
+
+def test_bundle_index_slices_every_file_out_of_the_bundle(tmp_path):
+    source, docs = write_sample_services(tmp_path)
+    generator.configure_docs(str(docs))
+    with open(source / "Friend.json", "w", encoding="utf-8") as json_file:
+        json.dump({"serviceName": "Friend", "operations": [
+            {"apiMethod": "ReadFriend", "desc": "Reads a friend’s profile", "paramInfo": []}]}, json_file)
+
+    files = generator.generate(str(source), generator.BundleSink(generator.MemorySink())).sink.files
+    bundle = files[generator.BUNDLE_FILE_NAME]
+    index = json.loads(files[generator.BUNDLE_INDEX_FILE_NAME])
+    assert list(index["files"]) == files["dts_file_names"].splitlines()
+    for name, entry in index["files"].items():
+        data = bundle[entry["offset"]:entry["offset"] + entry["length"]]
+        assert data.decode('utf-8') == files[name]
+        assert hashlib.sha256(data).hexdigest() == entry["sha256"]
+    assert gzip.decompress(files[f"{generator.BUNDLE_FILE_NAME}.gz"]) == bundle
+
+
+def test_server_renders_requested_services_and_answers_304_while_unchanged(tmp_path):
+    source, docs = write_sample_services(tmp_path)
+    generator.configure_docs(str(docs))
+    server = generator.DtsServer(("127.0.0.1", 0), str(source), ThreadPoolExecutor(max_workers=1))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def get(path, headers={}):
+        try:
+            with urllib.request.urlopen(urllib.request.Request(base_url + path, headers=headers)) as response:
+                return response.status, response.headers["ETag"], response.read().decode('utf-8')
+        except urllib.error.HTTPError as error:
+            return error.code, error.headers["ETag"], error.read().decode('utf-8')
+
+    try:
+        status, etag, content = get("/dts/friend")
+        assert status == 200
+        assert "interface FriendServiceProxy {" in content
+        assert get("/dts/lib.cloudcode.friend-service-proxy.d.ts")[2] == content
+        assert get("/dts/Friend", {"If-None-Match": etag})[0] == 304
+        assert "getGroupServiceProxy(session?: string)" in get("/dts/service-proxies")[2]
+        assert get("/dts/missing")[0] == 404
+        assert get("/other/friend")[0] == 404
+
+        write_service_json(source / "Friend.json", "Friend", ["ReadFriend", "AddFriends"])
+        status, changed_etag, changed = get("/dts/friend", {"If-None-Match": etag})
+        assert (status, "addFriends(): ServiceProxyResponse;" in changed) == (200, True)
+        assert changed_etag != etag
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_model_snapshot_reuses_the_models_of_unchanged_files(tmp_path):
+    source, docs = write_sample_services(tmp_path)
+    models = {}
+    first = list(generator.iter_services(str(source), models=models))
+    generator.save_model_snapshot(str(tmp_path), "settings", models, {"page hash": generator.STRING_TYPE})
+    assert generator.load_model_snapshot(str(tmp_path), "other settings") == ({}, {})
+
+    models, return_types = generator.load_model_snapshot(str(tmp_path), "settings")
+    assert return_types == {"page hash": generator.STRING_TYPE}
+    write_service_json(source / "Group.json", "Group", ["ReadGroup", "AddGroup"])
+    generator.stats.reset()
+    services = list(generator.iter_services(str(source), models=models))
+    assert generator.stats.snapshot()["counters"]["models_reused"] == 1
+    assert [operation.name for operation in services[0].operations] == [operation.name for operation in first[0].operations]
+    assert [operation.name for operation in services[1].operations] == ["readGroup", "addGroup"]
+    assert models["Group"][1] is services[1]
+
+
+def test_hashed_assets_are_content_addressed_copies_with_their_integrity(tmp_path, monkeypatch):
+    source, docs = write_sample_services(tmp_path)
+    generator.configure_docs(str(docs))
+    files = generator.generate(str(source), generator.HashedSink(generator.MemorySink())).sink.files
+    assets = json.loads(files[generator.ASSETS_FILE_NAME])["files"]
+    assert set(assets) == set(files["dts_file_names"].splitlines()) | {generator.COMPLETION_INDEX_FILE_NAME}
+    for name, entry in assets.items():
+        data = files[entry["file"]]
+        assert data == files[name].encode('utf-8')
+        assert entry["integrity"] == "sha384-" + base64.b64encode(hashlib.sha384(data).digest()).decode('ascii')
+        assert gzip.decompress(files[entry["encodings"]["gzip"]["file"]]) == data
+
+    # A second run into the same folder keeps the copies of the first one instead of compressing them again.
+    target = tmp_path / "out"
+    target.mkdir()
+    generator.generate(str(source), generator.HashedSink(generator.ManifestSink(str(target), "settings")))
+    rendered = []
+    monkeypatch.setattr(generator, "render_asset", lambda name, data: rendered.append(name))
+    generator.generate(str(source), generator.HashedSink(generator.ManifestSink(str(target), "settings"),
+                                                         generator.load_assets(str(target))))
+    assert rendered == []
+    assert json.loads((target / generator.ASSETS_FILE_NAME).read_text())["files"] == assets
+
+
+def test_tar_sink_holds_the_same_outputs_as_a_memory_sink(tmp_path, monkeypatch):
+    source, docs = write_sample_services(tmp_path)
+    generator.configure_docs(str(docs))
+    files = generator.generate(str(source), generator.MemorySink()).files
+    archives = []
+    for now in (1000000000, 1000000060):
+        monkeypatch.setattr(time, "time", lambda: now)
+        archive = io.BytesIO()
+        generator.generate(str(source), generator.TarSink(archive))
+        archives.append(archive.getvalue())
+
+    assert archives[0] == archives[1]
+    with tarfile.open(fileobj=io.BytesIO(archives[0])) as tar:
+        assert {member.name: tar.extractfile(member).read().decode('utf-8') for member in tar} == files
+        assert {member.mtime for member in tar} == {0}
@@ -1,355 +1,264 @@
+import argparse
+import cProfile
 import json
-import re
+import multiprocessing
 import os
-# import requests # Import the requests library
-import urllib.request
-import urllib.error
-import ssl
-
-GITHUB_BASE_URL = "https://raw.githubusercontent.com/getbraincloud/braincloud-docs/develop/docs/api/2_capi/"
-
-MAX_DEPTH_FOR_TYPE_GENERATION = 3 # Define the maximum depth for type generation in data json
-
-EXCLUDED_METHODS = {
-    # "Identity": ["attach", "merge", "detach"],
-    # "VirtualCurrency": ["resetCurrencyState"]
-    "AppStore": ["awardProductHook"]
-}
-
-EXCLUDED_SERVICES = ["Script", "Authenticate", "Dispatcher"]
-
-# def fetch_md_content(service_name, method_name):
-#     url = f"{GITHUB_BASE_URL}{service_name}/{method_name}.md"
-#     try:
-#         headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-#         response = requests.get(url, headers=headers, timeout=10) # Removed verify=False again
-#         response.raise_for_status()  # Raise an exception for HTTP errors
-#         return response.text
-#     except requests.exceptions.RequestException as e:
-#         # print(f"Error fetching {url}: {e}")
-#         return None
-
-def fetch_md_content(service_name, method_name):
-    url = f"{GITHUB_BASE_URL}{service_name}/{method_name}.md"
-    
-    try:
-        # Create request with headers
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        req = urllib.request.Request(url, headers=headers)
-        
-        # Open the URL with timeout
-        response = urllib.request.urlopen(req, timeout=10, context=ssl._create_unverified_context())
-        
-        # Read and decode the response
-        content = response.read().decode('utf-8')
-        
-        return content
-        
-    # except urllib.error.HTTPError as e:
-    #     # HTTP error (404, 500, etc.)
-    #     print(f"HTTP Error fetching {url}: {e.code} {e.reason}")
-    #     return None
-    # except urllib.error.URLError as e:
-    #     # URL/connection error
-    #     print(f"URL Error fetching {url}: {e.reason}")
-    #     return None
-    # except TimeoutError:
-    #     print(f"Timeout fetching {url}")
-    #     return None
-    except Exception as e:
-        # Other exceptions
-        print(f"Error fetching {url}: {e}")
-        return None
-
-def sanitizeMethodName(sourceMethodName):
-    sanitizedMethodName = sourceMethodName.lstrip().rstrip()
-
-    if sanitizedMethodName.find(" ") > -1:
-        sanitizedMethodName = sanitizedMethodName[0:sanitizedMethodName.find(" ")]
-
-    if sanitizedMethodName.find("(") > -1:
-        sanitizedMethodName = sanitizedMethodName[0:sanitizedMethodName.find("(")]
-
-    if sanitizedMethodName.find("{") > -1:
-        sanitizedMethodName = sanitizedMethodName[0:sanitizedMethodName.find("{")]
-
-    if sanitizedMethodName.find("[") > -1:
-        sanitizedMethodName = sanitizedMethodName[0:sanitizedMethodName.find("[")]
-
-    sanitizedMethodName = sanitizedMethodName.lstrip().rstrip()
-
-    if len(sanitizedMethodName) > 0:
-        if len(sanitizedMethodName) > 1:
-            sanitizedMethodName = sanitizedMethodName[0].lower() + sanitizedMethodName[1:]
-        else:
-            sanitizedMethodName = sanitizedMethodName[0].lower()
-
-    return sanitizedMethodName
-
-
-def sanitizeParameterType(sourceParameterType):
-    sanitizedParameterType = sourceParameterType.lstrip().rstrip()
-
-    if sanitizedParameterType.find("|") == -1:
-        sanitizedParameterType = sourceParameterType.lstrip().rstrip().lower()
-
-    if sanitizedParameterType == "string":
-        return "string"
-    elif sanitizedParameterType == "number" or sanitizedParameterType == "integer" or sanitizedParameterType == "int" or sanitizedParameterType == "long" or sanitizedParameterType == "float" or sanitizedParameterType == "double" or sanitizedParameterType == "biginteger":
-        return "number"
-    elif sanitizedParameterType == "boolean" or sanitizedParameterType == "bool":
-        return "boolean"
-    elif sanitizedParameterType == "nativeobject":
-        return "Object"
-    elif sanitizedParameterType == "nativearray":
-        return "Array<any>"
-    elif sanitizedParameterType == "stringarray":
-        return "Array<string>"
-    elif sanitizedParameterType == "numberarray" or sanitizedParameterType == "integerarray" or sanitizedParameterType == "intarray" or sanitizedParameterType == "longarray" or sanitizedParameterType == "floatarray" or sanitizedParameterType == "doublearray" or sanitizedParameterType == "bigintegerarray":
-        return "Array<number>"
-    elif sanitizedParameterType == "booleanarray" or sanitizedParameterType == "boolarray":
-        return "Array<boolean>"
-    elif sanitizedParameterType == "map":
-        return "Map<any, any>"
-    elif sanitizedParameterType == "list":
-        return "Array<any>"
-    else:
-        if sourceParameterType.find("|") > -1:
-            parts = sourceParameterType.split("|")
-
-            multiPartString = ""
-
-            for part in parts:
-                if len(multiPartString) > 0:
-                    multiPartString = multiPartString + " | " + "\"" + part.lstrip().rstrip() + "\""
-                else:
-                    multiPartString = "\"" + part.lstrip().rstrip() + "\""
-
-            return multiPartString
-        else:
-            return sourceParameterType.lstrip().rstrip()
-
-
-def extract_json_response(markdown_content):
-    # Regex to find the JSON response block within the markdown
-    match = re.search(r'<details>\s*<summary>JSON Response</summary>\s*```json\s*(.*?)\s*```\s*</details>', markdown_content, re.DOTALL)
-    if match:
-        json_str = match.group(1)
-        try:
-            return json.loads(json_str)
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON: {e} in {json_str}")
-            return None
-    return None
-
-
-def convert_json_to_typescript(json_obj, base_indent_string, current_depth):
-    ts_string = ""
-    current_indent = base_indent_string
-
-    if isinstance(json_obj, dict):
-        for key, value in json_obj.items():
-            sanitized_key = re.sub(r'[^a-zA-Z0-9_]', '', key)
-
-            if isinstance(value, dict):
-                if current_depth >= MAX_DEPTH_FOR_TYPE_GENERATION - 1:
-                    ts_string += f"{current_indent}{sanitized_key}: Record<string, any>;\n"
-                else:
-                    ts_string += f"{current_indent}{sanitized_key}: {{\n"
-                    ts_string += convert_json_to_typescript(value, current_indent + "    ", current_depth + 1)
-                    ts_string += f"{current_indent}}};\n"
-            elif isinstance(value, list):
-                if len(value) > 0 and isinstance(value[0], dict):
-                    if current_depth >= MAX_DEPTH_FOR_TYPE_GENERATION - 1:
-                        ts_string += f"{current_indent}{sanitized_key}: Array<Record<string, any>>;\n"
-                    else:
-                        ts_string += f"{current_indent}{sanitized_key}: Array<{{\n"
-                        ts_string += convert_json_to_typescript(value[0], current_indent + "    ", current_depth + 1)
-                        ts_string += f"{current_indent}}}>;\n"
-                else:
-                    # Existing logic for list of primitives or empty list
-                    list_element_type = "any"
-                    if len(value) > 0:
-                        if isinstance(value[0], str): list_element_type = "string"
-                        elif isinstance(value[0], int) or isinstance(value[0], float): list_element_type = "number"
-                        elif isinstance(value[0], bool): list_element_type = "boolean"
-                    ts_string += f"{current_indent}{sanitized_key}: Array<{list_element_type}>;\n"
-            elif isinstance(value, str):
-                ts_string += f"{current_indent}{sanitized_key}: string;\n"
-            elif isinstance(value, int) or isinstance(value, float):
-                ts_string += f"{current_indent}{sanitized_key}: number;\n"
-            elif isinstance(value, bool):
-                ts_string += f"{current_indent}{sanitized_key}: boolean;\n"
-            elif value is None:
-                ts_string += f"{current_indent}{sanitized_key}: any | null;\n"
-            else:
-                ts_string += f"{current_indent}{sanitized_key}: any;\n"
-        return ts_string
-    elif isinstance(json_obj, list):
-        if len(json_obj) > 0:
-            if isinstance(json_obj[0], dict):
-                if current_depth >= MAX_DEPTH_FOR_TYPE_GENERATION - 1:
-                     return f"Array<Record<string, any>>"
-                else:
-                    inner_content = convert_json_to_typescript(json_obj[0], current_indent + "    ", current_depth + 1)
-                    return f"Array<{{\n{inner_content}{current_indent}}}>"
-            else:
-                # Existing logic for list of primitives
-                if isinstance(json_obj[0], str): return "Array<string>"
-                elif isinstance(json_obj[0], int) or isinstance(json_obj[0], float): return "Array<number>"
-                elif isinstance(json_obj[0], bool): return "Array<boolean>"
-                else: return "Array<any>"
-        else:
-            return "Array<any>"
-    return ""
-
-
-source_path = "/Users/jasonl//bitbucket/braincloud-portal/Development/Server-AppServer/src/main/webapp/js/json/"
-target_path = "./DTS_Files"
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-proxy_name_array = []
-file_name_array = []
+import dts_generator as generator
 
-for file in os.scandir(source_path):
-    if file.name.endswith(".json") and file.name[:-5] not in EXCLUDED_SERVICES:
-        proxy_name_array.append(file.name[:-5])
+SOURCE_PATH = "/Users/jasonl//bitbucket/braincloud-portal/Development/Server-AppServer/src/main/webapp/js/json/" # Define the folder the service JSON files are read from
+TARGET_PATH = "./DTS_Files" # Define the folder the outputs are written to
 
-proxy_name_array.sort()
+SERVE_ADDRESS = "127.0.0.1:8787" # Define where --serve listens by default
 
-if not os.path.isdir(target_path):
-    os.mkdir(target_path)
+PROFILE_PATH = "./dts_profile.json" # Define where --profile writes the run report by default
 
-# Begin generation of the "lib.cloudcode.service-proxies.d.ts" file.
-# This contains the "get<XXX>ServiceProxy" function definitions that are applied to the main Bridge interface.
-with open(f"{target_path}/lib.cloudcode.service-proxies.d.ts", "w") as globaldts:
-    globaldts.write(f'/// <reference no-default-lib="true"/>\n\n')
-    globaldts.write(f'interface ServiceProxies {{\n')
 
-# Process each source JSON file.
-for proxy in proxy_name_array:
+def parse_serve_address(value):
+    host, separator, port = value.rpartition(":")
     try:
-        with open(f"{source_path}/{proxy}.json", "r") as output:
-            data = json.load(output)
-    except FileNotFoundError:
-        print(f"File does not exist: {source_path}/{proxy}.json")
+        return (host if separator else "127.0.0.1"), int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected [HOST:]PORT, got {value!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the brainCloud cloud code service proxy DTS files.")
+    parser.add_argument("--source", default=SOURCE_PATH,
+                        help="folder the service JSON files are read from (default: the braincloud-portal checkout)")
+    parser.add_argument("--target", default=TARGET_PATH, help=f"folder the outputs are written to (default {TARGET_PATH})")
+    parser.add_argument("--fetch-jobs", type=int, default=generator.FETCH_CONCURRENCY,
+                        help=f"maximum number of documentation pages fetched concurrently (default {generator.FETCH_CONCURRENCY})")
+    parser.add_argument("--docs", default=generator.GITHUB_BASE_URL,
+                        help="where to read the documentation pages from: a URL, a local braincloud-docs checkout "
+                             "or a downloaded tarball of it (default: the braincloud-docs GitHub repository)")
+    parser.add_argument("--rate-limit", type=float, default=generator.HTTP_RATE_LIMIT,
+                        help=f"maximum documentation requests per second, 0 for no limit (default {generator.HTTP_RATE_LIMIT})")
+    parser.add_argument("--retries", type=int, default=generator.HTTP_RETRIES,
+                        help=f"times a timeout, connection error, 429 or 5xx response is retried (default {generator.HTTP_RETRIES})")
+    parser.add_argument("--cache-dir", default=generator.CACHE_PATH,
+                        help=f"directory the fetched documentation pages are cached in (default {generator.CACHE_PATH})")
+    parser.add_argument("--no-cache", action="store_true", help="fetch every documentation page without caching")
+    parser.add_argument("--max-age", type=int, default=None,
+                        help="seconds a cached page is used without revalidation (default: always revalidate)")
+    parser.add_argument("--cache-max-bytes", type=int, default=generator.CACHE_MAX_BYTES,
+                        help=f"size the cache is trimmed back to after the run (default {generator.CACHE_MAX_BYTES})")
+    parser.add_argument("--refresh", action="store_true",
+                        help="ignore the cached pages (including remembered 404s) and download everything again")
+    parser.add_argument("--git-rev",
+                        help="read the service JSON files from this revision (branch, tag or commit) of the "
+                             "braincloud-portal repository instead of its working tree, without checking it out")
+    parser.add_argument("--batch", nargs="+", type=parse_batch_version, metavar="NAME=SOURCE",
+                        help="generate several versions in one run, each from a folder of service JSON files or a "
+                             "git revision and written to its own NAME folder below the target folder; "
+                             "documentation pages and services the versions have in common are fetched and inferred once")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of processes rendering services in parallel (default 1)")
+    parser.add_argument("--bundle", action="store_true",
+                        help=f"also write every output into {generator.BUNDLE_FILE_NAME} (plus a .gz variant) "
+                             f"with a name -> offset/length/sha256 index in {generator.BUNDLE_INDEX_FILE_NAME}")
+    parser.add_argument("--hashed", action="store_true",
+                        help=f"also write a content-addressed copy of each output, with precompressed .gz "
+                             f"(and .br, if brotli is installed) variants, mapped by name, size and SRI hash in "
+                             f"{generator.ASSETS_FILE_NAME}")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and regenerate the outputs of each service JSON as it changes")
+    parser.add_argument("--serve", nargs="?", const=parse_serve_address(SERVE_ADDRESS), type=parse_serve_address,
+                        metavar="[HOST:]PORT",
+                        help=f"instead of writing files, serve GET /dts/<service> and GET /dts/service-proxies, "
+                             f"generating each on first request and again only when its JSON changes "
+                             f"(default address {SERVE_ADDRESS})")
+    parser.add_argument("--no-validate", action="store_true",
+                        help="skip the syntax check of the generated declaration files")
+    parser.add_argument("--previous-index",
+                        help=f"{generator.SIGNATURE_INDEX_FILE_NAME} of an earlier run; the methods and files changed "
+                             f"since then are written to {generator.DELTA_FILE_NAME}")
+    parser.add_argument("--force", action="store_true",
+                        help=f"ignore {generator.MANIFEST_FILE_NAME} and re-render every service")
+    parser.add_argument("--profile", nargs="?", const=PROFILE_PATH, default=None,
+                        help=f"write a JSON report of where the time of the run went (default path {PROFILE_PATH})")
+    parser.add_argument("--cprofile", help="also write a cProfile dump of the run to this path")
+    args = parser.parse_args()
+
+    if args.profile:
+        tracemalloc.start()
+    if args.cprofile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    started = time.perf_counter()
+
+    failed = False
+    try:
+        run(args)
+    except generator.CircuitOpenError as e:
+        # Rather than rewrite every output without the return types of the pages that could not be fetched.
+        print(f"Stopping before writing the outputs, the documentation could not be fetched: {e}")
+        failed = True
+    except ValueError as e:
+        # A --docs location, --git-rev or --batch revision that cannot be read.
+        print(e)
+        failed = True
+    finally:
+        if args.cprofile:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+        if args.profile:
+            report = generator.stats.report()
+            report["wall_seconds"] = time.perf_counter() - started
+            report["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+            report["arguments"] = {name: value for name, value in vars(args).items()}
+            tracemalloc.stop()
+            with open(args.profile, "w") as profile_file:
+                json.dump(report, profile_file, indent=2)
+            print(f"Wrote the run report to {args.profile}")
+
+    if failed:
+        sys.exit(1)
+
+
+def parse_batch_version(value):
+    # A --batch version is "NAME=SOURCE": SOURCE is a folder of service JSON files or a git revision
+    # of the repository the source folder belongs to, and the outputs are written to "<target>/NAME".
+    name, separator, source = value.partition("=")
+    if not separator or not name or not source or "/" in name or name in (".", ".."):
+        raise argparse.ArgumentTypeError(f"expected NAME=FOLDER or NAME=REVISION, got {value!r}")
+    return name, source
+
+
+def run(args):
+    generator.configure_docs(args.docs, fetch_jobs=args.fetch_jobs, rate_limit=args.rate_limit, retries=args.retries,
+                             cache_dir=None if args.no_cache else args.cache_dir, max_age=args.max_age,
+                             cache_max_bytes=args.cache_max_bytes, refresh=args.refresh)
+
+    source_path = args.source
+    target_path = args.target
+
+    if args.serve:
+        if args.git_rev or args.batch or args.watch:
+            print("--serve follows the working tree and cannot be combined with --git-rev, --batch or --watch.")
+            return
+        server = generator.DtsServer(args.serve, source_path, ThreadPoolExecutor(max_workers=max(1, args.fetch_jobs)),
+                                     validate=not args.no_validate)
+        print(f"Serving the typings of {source_path} on http://{args.serve[0]}:{server.server_address[1]}/dts/, "
+              f"press Ctrl+C to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        return
+
+    if not os.path.isdir(target_path):
+        os.mkdir(target_path)
+
+    if args.watch:
+        if args.git_rev or args.batch:
+            print("--watch follows the working tree and cannot be combined with --git-rev or --batch.")
+            return
+        proxy_name_array = sorted(name[:-5] for name in generator.DirectoryJsonSource(source_path).names()
+                                  if name[:-5] not in generator.EXCLUDED_SERVICES)
+        try:
+            generator.WatchSession(source_path, target_path, ThreadPoolExecutor(max_workers=max(1, args.fetch_jobs)),
+                                   validate=not args.no_validate).run(proxy_name_array)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # Each version is written to its own folder; a single run is just one version written to the target folder.
+    if args.batch:
+        versions = []
+        for name, source in args.batch:
+            if os.path.isdir(source):
+                versions.append((name, f"{target_path}/{name}", generator.DirectoryJsonSource(source)))
+            else:
+                versions.append((name, f"{target_path}/{name}", generator.GitJsonSource(source_path, source)))
     else:
-        service_name = data["serviceName"]
-
-        # Massage the service name into an appropriate proxy name (used as part of the output file name).
-        proxy_name = re.sub(r'(?<!^)(?=[A-Z])', '-',
-                            re.sub(r'^([A-Z0-9]+(?![a-z0-9]))(.*)$', lambda pat: pat.group(1).lower() + pat.group(2),
-                                   service_name)).lower()
-
-        # Construct the target output file name.
-        output_file = f"lib.cloudcode.{proxy_name}-service-proxy.d.ts"
-
-        # Append the new output file name to our list of file names.
-        file_name_array.append(output_file)
-
-        # Append the "get<XXX>ServiceProxy" function definition to the "lib.cloudcode.service-proxies.d.ts" file.
-        with open(f"{target_path}/lib.cloudcode.service-proxies.d.ts", "a") as globaldts:
-            globaldts.write(f'\t/**\n')
-            globaldts.write(f'\t * Retrieves a {data["serviceName"]}Service proxy object.\n')
-            globaldts.write(f'\t * \n')
-            globaldts.write(
-                f'\t * @param session A optional parameter for when a script is executed without a session.\n')
-            globaldts.write(f'\t */ \n')
-            globaldts.write(
-                f'\tget{data["serviceName"]}ServiceProxy(session?: string): {data["serviceName"]}ServiceProxy;\n\n')
-
-        with open(f"{target_path}/{output_file}", "w") as file:
-            file.write(f'/// <reference no-default-lib="true"/>\n\n')
-            file.write(f'interface {service_name}ServiceProxy {{\n')
-
-            count = 0
-            length = len(data["operations"])
-
-            processed_methods = []
-
-            # Process each defined operation.
-            for method in data["operations"]:
-                method_name = sanitizeMethodName(method["apiMethod"])
-
-                # If the method name for the operation is an empty string, ignore it.
-                if len(method_name.lstrip().rstrip()) == 0:
-                    continue
-
-                # Check if the method is excluded for this service
-                if service_name in EXCLUDED_METHODS and method_name in EXCLUDED_METHODS[service_name]:
-                    continue
-
-                # Determine if we've already processed this operation.
-                # There are aliases defined in the source JSON, so we only want to process the first occurance.
-                methodAlreadyProcessed = False
-                try:
-                    processed_methods.index(method_name)
-                    methodAlreadyProcessed = True
-                except ValueError:
-                    methodAlreadyProcessed = False
-
-                # If the operation has already been processed, ignore it.
-                if methodAlreadyProcessed:
-                    continue
-
-                # Append the method name for the operation to our list of processed methods.
-                processed_methods.append(method_name)
-
-                typescript_return_type_content = ""
-                md_content = fetch_md_content(service_name.lower(), method["apiMethod"].lower())
-                if md_content:
-                    json_response = extract_json_response(md_content)
-                    if json_response:
-                        typescript_return_type_content = convert_json_to_typescript(json_response, base_indent_string='\t\t', current_depth=0) # Start inner content with 1 tab + 2 spaces (6 spaces)
-
-                # Process the comments/jsdoc section, this contains a method description along with parameter descriptions.
-                file.write(f'\t/**\n')
-                file.write(f'\t * {method["desc"]}\n')
-                file.write(f'\t * \n')
-                param_string = ""
-                try:
-                    for param in method["paramInfo"]:
-                        try:
-                            file.write(
-                                f'\t * @param  {{{sanitizeParameterType(param["type"])}}} {param["name"]} {param["desc"]}\n')
-                        except KeyError:
-                            print(f'{service_name}.json - Parameter <{param["name"]}> missing "paramInfo.desc".')
-                        param_string += f'{param["name"]}: {sanitizeParameterType(param["type"])}, '
-                except KeyError:
-                    pass
-                    # print(f'{service_name}.json - Missing "paramInfo".')
-                file.write(f'\t * @returns ServiceProxyResponse\n')
-                file.write(f'\t */ \n')
-
-                if method_name == "createGroupWithSummaryData":
-                    method_name = "createGroup"
-
-                if param_string:
-                    file.write(f'\t{method_name}({param_string[0:-2]}): ')
-                else:
-                    file.write(f'\t{method_name}(): ')
-
-                if typescript_return_type_content:
-                    file.write('{\n')
-                    file.write(typescript_return_type_content)
-                    file.write('\t};\n')
-                else:
-                    file.write('ServiceProxyResponse;\n')
-
-                file.write('\n') # Ensure a single newline separates methods
-
-                count += 1
-
-                if count < length:
-                    file.write(f'\n')
-            file.write('}')
-
-# Finish generation of the "lib.cloudcode.service-proxies.d.ts" file.
-with open(f"{target_path}/lib.cloudcode.service-proxies.d.ts", "a") as globaldts:
-    globaldts.write('}')
-
-file_name_array.append("lib.cloudcode.service-proxies.d.ts")
-
-# Generate a "dts_file_names" file that contains a list of all output files.
-with open(f"{target_path}/dts_file_names", "w") as file_name:
-    for i in file_name_array:
-        file_name.write(f'{i}\n')
+        versions = [(None, target_path, generator.open_json_source(source_path, args.git_rev))]
+
+    # The documentation fetches, the inferred types, the parsed service JSON files and the built interfaces are shared
+    # by the versions of this run, so a page or a service JSON that several versions have in common is only fetched,
+    # parsed and inferred once.
+    executor = ThreadPoolExecutor(max_workers=max(1, args.fetch_jobs))
+    # The workers are spawned rather than forked, so they do not inherit the pipes of a --git-rev "git cat-file".
+    render_executor = None
+    if args.jobs > 1:
+        render_executor = ProcessPoolExecutor(max_workers=args.jobs, mp_context=multiprocessing.get_context("spawn"))
+    pages = {}
+    return_types = {}
+    normalized = {}
+    builds = {}
+
+    for name, version_target_path, json_source in versions:
+        if not os.path.isdir(version_target_path):
+            os.mkdir(version_target_path)
+        rendered_count, service_count, written_count = generate_version(
+            args, json_source, version_target_path, executor, render_executor, pages, return_types, normalized, builds)
+        json_source.close()
+        prefix = f"{name}: " if name is not None else ""
+        print(f"{prefix}Rendered {rendered_count} of {service_count} services, {written_count} files changed.")
+
+    executor.shutdown()
+    if render_executor is not None:
+        render_executor.shutdown()
+
+    if generator.docs_cache is not None:
+        generator.docs_cache.evict()
+
+
+def generate_version(args, json_source, target_path, executor, render_executor, pages, return_types, normalized, builds):
+    # Generate the outputs of one set of service JSON files into target_path, rendering only the services
+    # whose inputs changed since the previous run there and writing only the files whose content changed.
+    # "pages", "return_types", "normalized" and "builds" carry the documentation fetches, the inferred types,
+    # the parsed service JSON files and the built interfaces over to the next version.
+    settings = generator.settings_hash()
+
+    # Read the index of the earlier run before anything is written, as it is usually the one in this target folder.
+    previous_index = generator.load_signature_index(args.previous_index) if args.previous_index else None
+
+    # Files whose mtime and size (or git blob) did not change since the previous run are taken from the model snapshot,
+    # and so are the return types inferred from the pages that did not change.
+    models, saved_return_types = ({}, {}) if args.force else generator.load_model_snapshot(target_path, settings)
+    previous_models = dict(models)
+    return_types.update(saved_return_types)
+
+    manifest = generator.ManifestSink(target_path, settings, force=args.force)
+    sink = manifest
+    if args.hashed:
+        sink = generator.HashedSink(sink, generator.load_assets(target_path))
+    if args.bundle:
+        sink = generator.BundleSink(sink)
+
+    # The documentation fetches of all services are queued up front, so the network round trips overlap with each
+    # other and with the type inference; with --jobs the services are built and rendered in a process pool.
+    services = generator.iter_services(json_source, models=models, normalized=normalized)
+    documented_services = manifest.track(generator.iter_operations(services, executor, pages, lookahead=None))
+    interfaces = generator.iter_interfaces(documented_services, return_types, render_executor, builds, lookahead=None)
+    generator.write_outputs(generator.render_outputs(interfaces, validate=not args.no_validate, executor=render_executor,
+                                                     renders=manifest, previous_index=previous_index), sink)
+
+    # Keep the return types of the pages this version documents, so the snapshot does not grow with every page ever seen.
+    version_return_types = {page_hash: return_types[page_hash] for service in manifest.manifest["services"].values()
+                            for page_hash in (service["docs"] or {}).values() if page_hash in return_types}
+    if models != previous_models or version_return_types != saved_return_types:
+        generator.save_model_snapshot(target_path, settings, models, version_return_types)
+
+    if previous_index is not None:
+        with open(f"{target_path}/{generator.DELTA_FILE_NAME}", "r") as delta_file:
+            delta = json.load(delta_file)
+        print(f"{sum(len(members) for interface in delta['interfaces'].values() for members in interface.values())} "
+              f"methods of {len(delta['interfaces'])} interfaces changed since the previous index, "
+              f"{len(delta['files'])} files regenerated, {len(delta['removed_files'])} removed.")
+
+    service_count = len(manifest.manifest["services"])
+    rendered_count = service_count - manifest.reused
+    generator.stats.count("services", service_count)
+    generator.stats.count("services_rendered", rendered_count)
+    return rendered_count, service_count, len(manifest.written)
+
+
+if __name__ == "__main__":
+    main()